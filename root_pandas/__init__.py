@@ -1,9 +1,19 @@
+from .cache import metadata_cache
+from .dask_io import read_root_dask
+from .planning import plan_chunks
+from .planning import read_chunk
+from .readwrite import RootWriter
 from .readwrite import read_root
 from .readwrite import to_root
 from .version import __version__
 
 __all__ = [
+    'RootWriter',
     '__version__',
+    'metadata_cache',
+    'plan_chunks',
+    'read_chunk',
+    'read_root_dask',
     'read_root',
     'to_root',
 ]
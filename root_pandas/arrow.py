@@ -0,0 +1,116 @@
+"""
+Conversion of the arrays read by read_root to Apache Arrow tables and record batches.
+
+The columns are converted from the numpy arrays returned by root_numpy without
+going through a DataFrame. Variable-length arrays become Arrow list arrays built
+from a single concatenated content array and its offsets, fixed-size arrays become
+fixed size lists and categorical columns become dictionary arrays.
+"""
+import numpy as np
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+from .readwrite import JAGGED_LENGTH_PREFIX, _is_numeric_jagged, _parse_categorical_name
+from .utils import array_lengths, lengths_to_offsets
+
+
+__all__ = [
+    'convert_to_arrow',
+    'to_arrow_array',
+]
+
+
+def _fixed_size_list_array(values):
+    """Convert an array of shape (n, k, ...) to nested fixed size lists"""
+    result = pa.array(np.ascontiguousarray(values).reshape(-1))
+    for size in reversed(values.shape[1:]):
+        result = pa.FixedSizeListArray.from_arrays(result, size)
+    return result
+
+
+def _list_array(values):
+    """Convert an object array of numeric arrays to a list array"""
+    lengths = array_lengths(values)
+    offsets = lengths_to_offsets(lengths)
+    if len(values) and offsets[-1]:
+        content = np.concatenate([np.asarray(x) for x in values])
+    elif len(values):
+        content = np.asarray(values[0])[:0]
+    else:
+        content = np.empty(0, dtype=np.float64)
+    if offsets[-1] > np.iinfo(np.int32).max:
+        return pa.LargeListArray.from_arrays(pa.array(offsets), to_arrow_array(content))
+    return pa.ListArray.from_arrays(pa.array(offsets.astype(np.int32)), to_arrow_array(content))
+
+
+def to_arrow_array(values):
+    """Convert a column read by root_numpy to an Arrow array without converting it row by row.
+
+    Parameters
+    ----------
+    values: numpy.ndarray
+        The column, either of a numeric, boolean or string dtype, a (n, k, ...) array of fixed-size
+        arrays or an object array of variable-length numeric arrays
+
+    Returns
+    -------
+        A pyarrow.Array
+    """
+    if pa is None:
+        raise ImportError('Converting to Arrow requires pyarrow')
+    if values.dtype.hasobject:
+        if len(values) == 0 or _is_numeric_jagged(values):
+            return _list_array(values)
+        # Arbitrary objects, such as vectors of strings, can only be converted row by row
+        return pa.array(list(values))
+    if values.ndim >= 2:
+        return _fixed_size_list_array(values)
+    return pa.array(np.ascontiguousarray(values))
+
+
+def convert_to_arrow(array, batch=False):
+    """Convert the structured array returned by root_numpy to an Arrow table.
+
+    The `__index__*` branch becomes a normal column named after the index, or
+    `__index_level_0__` if the index has no name (like `pyarrow.Table.from_pandas`).
+
+    Parameters
+    ----------
+    array: structured array or mapping of column names to arrays
+        The columns to convert
+    batch: bool (optional, default: False)
+        If True, a pyarrow.RecordBatch is returned instead of a pyarrow.Table
+
+    Returns
+    -------
+        A pyarrow.Table or pyarrow.RecordBatch
+    """
+    if pa is None:
+        raise ImportError('Converting to Arrow requires pyarrow')
+    names = list(array) if isinstance(array, dict) else array.dtype.names
+    columns = []
+    column_names = []
+    for name in names:
+        if name.startswith(JAGGED_LENGTH_PREFIX):
+            continue
+        values = array[name]
+        categorical = _parse_categorical_name(name)
+        if name.startswith('__index__'):
+            column = to_arrow_array(values)
+            name = name[len('__index__'):] or '__index_level_0__'
+        elif categorical:
+            name, ordered, categories = categorical
+            codes = np.ascontiguousarray(values)
+            # Missing values are stored with the code -1
+            column = pa.DictionaryArray.from_arrays(
+                pa.array(codes, mask=codes < 0), pa.array(categories, type=pa.string()), ordered=ordered)
+        else:
+            column = to_arrow_array(values)
+        columns.append(column)
+        column_names.append(name)
+    if batch:
+        return pa.RecordBatch.from_arrays(columns, names=column_names)
+    return pa.Table.from_arrays(columns, names=column_names)
@@ -0,0 +1,285 @@
+"""
+Caches for metadata read from ROOT files and for the data read by read_root.
+"""
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+
+import numpy as np
+
+from root_numpy.extern.six import string_types
+
+
+__all__ = [
+    'DataCache',
+    'MetadataCache',
+    'metadata_cache',
+    'parse_size',
+]
+
+_SIZE_UNITS = {
+    '': 1, 'B': 1,
+    'KB': 10**3, 'MB': 10**6, 'GB': 10**9, 'TB': 10**12,
+    'KIB': 2**10, 'MIB': 2**20, 'GIB': 2**30, 'TIB': 2**40,
+}
+
+
+def parse_size(size):
+    """Return the number of bytes of a size such as 512, '512MB', '1.5 GB' or '2GiB'."""
+    if not isinstance(size, string_types):
+        if size is None or size < 0:
+            raise ValueError('Invalid size: {!r}'.format(size))
+        return int(size)
+    match = re.match(r'^\s*(\d+(?:\.\d*)?|\.\d+)\s*([a-zA-Z]*)\s*$', size)
+    if not match or match.group(2).upper() not in _SIZE_UNITS:
+        raise ValueError('Invalid size: {!r}. Must be a number of bytes or a string such as "512MB".'.format(size))
+    value, unit = match.groups()
+    return int(float(value) * _SIZE_UNITS[unit.upper()])
+
+
+def get_file_stamp(path):
+    """Return a tuple identifying the current version of a local file, or None if it isn't a local file."""
+    try:
+        stat = os.stat(path)
+    except (OSError, TypeError, ValueError):
+        # Remote files (root://, http://...) can't be checked for modifications
+        return None
+    return [stat.st_mtime, stat.st_size, stat.st_ino]
+
+
+class MetadataCache(object):
+    """An in-process LRU cache of metadata of ROOT files, such as their trees, branches and entries.
+
+    Entries are keyed by the path, modification time, size and inode of the file, so modified files
+    are read again. Remote files are never cached.
+
+    Parameters
+    ----------
+    maxsize: int (optional, default: 4096)
+        The maximum number of cached values, 0 disables the cache
+    sidecar_dir: string (optional, default: None)
+        If given, the metadata of each file is also stored as a JSON file in this directory,
+        so that it can be reused by other processes.
+    """
+
+    def __init__(self, maxsize=4096, sidecar_dir=None):
+        self.maxsize = maxsize
+        self.sidecar_dir = sidecar_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def clear(self):
+        """Remove all values from the in-process cache."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, path, name, args=()):
+        """Return a tuple of whether a value is cached and the value."""
+        stamp = get_file_stamp(path)
+        if stamp is None or not self.maxsize:
+            return False, None
+        key = (os.path.abspath(path), name, json.dumps(args))
+        with self._lock:
+            if key in self._entries:
+                cached_stamp, value = self._entries.pop(key)
+                if cached_stamp == stamp:
+                    self._entries[key] = (cached_stamp, value)
+                    return True, value
+        if self.sidecar_dir:
+            found, value = self._read_sidecar(key, stamp)
+            if found:
+                self._store(key, stamp, value)
+                return True, value
+        return False, None
+
+    def store(self, path, name, args, value):
+        """Store a JSON serialisable value for the current version of the file."""
+        stamp = get_file_stamp(path)
+        if stamp is None or not self.maxsize:
+            return
+        key = (os.path.abspath(path), name, json.dumps(args))
+        self._store(key, stamp, value)
+        if self.sidecar_dir:
+            self._write_sidecar(key, stamp, value)
+
+    def get(self, path, name, args, compute):
+        """Return the cached value or compute and store it."""
+        found, value = self.lookup(path, name, args)
+        if not found:
+            value = compute()
+            self.store(path, name, args, value)
+        return value
+
+    def _store(self, key, stamp, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (stamp, value)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _sidecar_path(self, path):
+        digest = hashlib.sha1(path.encode('utf-8')).hexdigest()
+        return os.path.join(self.sidecar_dir, digest + '.json')
+
+    def _read_sidecar(self, key, stamp):
+        path, name, args = key
+        try:
+            with open(self._sidecar_path(path)) as sidecar:
+                content = json.load(sidecar)
+        except (IOError, OSError, ValueError):
+            return False, None
+        if content.get('stamp') != stamp or name + args not in content['values']:
+            return False, None
+        return True, content['values'][name + args]
+
+    def _write_sidecar(self, key, stamp, value):
+        path, name, args = key
+        sidecar_path = self._sidecar_path(path)
+        try:
+            with open(sidecar_path) as sidecar:
+                content = json.load(sidecar)
+            if content.get('stamp') != stamp:
+                raise ValueError('Outdated sidecar')
+        except (IOError, OSError, ValueError):
+            content = {'path': path, 'stamp': stamp, 'values': {}}
+        content['values'][name + args] = value
+        try:
+            if not os.path.isdir(self.sidecar_dir):
+                os.makedirs(self.sidecar_dir)
+            # Write atomically as other processes might read the sidecar concurrently
+            tmp_path = '{}.{}.tmp'.format(sidecar_path, os.getpid())
+            with open(tmp_path, 'w') as sidecar:
+                json.dump(content, sidecar)
+            os.rename(tmp_path, sidecar_path)
+        except (IOError, OSError):
+            pass
+
+
+class DataCache(object):
+    """A directory of the arrays read by read_root, so that repeated reads only need to map files into memory.
+
+    Every entry is a directory containing one `.npy` file per column, which are memory-mapped
+    when loaded. Columns of python objects, such as variable-length arrays, are pickled and
+    loaded into memory. When the total size exceeds `max_size`, the least recently used entries
+    are removed. The directory can be shared by several processes.
+
+    Parameters
+    ----------
+    directory: string
+        The directory containing the cache, which is created if needed
+    max_size: int or string (optional, default: '10GB')
+        The maximum total size of the cached entries, such as '500MB'
+    """
+
+    def __init__(self, directory, max_size='10GB'):
+        self.directory = directory
+        self.max_size = parse_size(max_size)
+
+    @staticmethod
+    def make_key(paths, **params):
+        """Return the key of the data read from the local files with JSON serialisable parameters.
+
+        The key includes the modification time, size and inode of all files.
+        None is returned if any of the files is remote and can't be checked for modifications.
+        """
+        files = []
+        for path in paths:
+            stamp = get_file_stamp(path)
+            if stamp is None:
+                return None
+            files.append([os.path.abspath(path), stamp])
+        content = json.dumps([files, params], sort_keys=True, default=repr)
+        return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, key)
+
+    def load(self, key):
+        """Return an OrderedDict of the cached columns, or None if the key isn't cached."""
+        entry_path = self._entry_path(key)
+        meta_path = os.path.join(entry_path, 'meta.json')
+        try:
+            with open(meta_path) as meta_file:
+                meta = json.load(meta_file)
+            columns = OrderedDict()
+            for i, name in enumerate(meta['names']):
+                column_path = os.path.join(entry_path, '{}.npy'.format(i))
+                if name in meta['objects']:
+                    columns[name] = np.load(column_path, allow_pickle=True)
+                else:
+                    # Copy-on-write, so that the DataFrame can be modified without changing the cache
+                    columns[name] = np.load(column_path, mmap_mode='c')
+            # Mark the entry as recently used
+            os.utime(meta_path, None)
+        except (IOError, OSError, ValueError, KeyError):
+            return None
+        return columns
+
+    def store(self, key, array):
+        """Store the columns of a structured array and evict old entries if the cache is too large."""
+        if array.nbytes > self.max_size:
+            return
+        tmp_path = '{}.{}.{}.tmp'.format(self._entry_path(key), os.getpid(), threading.current_thread().ident)
+        try:
+            os.makedirs(tmp_path)
+            objects = []
+            for i, name in enumerate(array.dtype.names):
+                column = array[name]
+                if column.dtype.hasobject:
+                    objects.append(name)
+                np.save(os.path.join(tmp_path, '{}.npy'.format(i)), column, allow_pickle=column.dtype.hasobject)
+            with open(os.path.join(tmp_path, 'meta.json'), 'w') as meta_file:
+                json.dump({'names': list(array.dtype.names), 'objects': objects, 'n_rows': len(array)}, meta_file)
+            # Entries appear atomically, as other processes might read them concurrently
+            os.rename(tmp_path, self._entry_path(key))
+        except (IOError, OSError):
+            # Already stored by another process or the cache isn't writable
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            return
+        self.evict()
+
+    def entries(self):
+        """Return a list of the keys, sizes and last access times of all cached entries."""
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except (IOError, OSError):
+            return entries
+        for name in names:
+            entry_path = self._entry_path(name)
+            if name.endswith('.tmp') or not os.path.isdir(entry_path):
+                continue
+            try:
+                files = [os.path.join(entry_path, file_name) for file_name in os.listdir(entry_path)]
+                size = sum(os.path.getsize(path) for path in files)
+                last_used = os.path.getmtime(os.path.join(entry_path, 'meta.json'))
+            except (IOError, OSError):
+                continue
+            entries.append((name, size, last_used))
+        return entries
+
+    def evict(self):
+        """Remove the least recently used entries until the cache is smaller than max_size."""
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        total_size = sum(size for _, size, _ in entries)
+        for key, size, _ in entries:
+            if total_size <= self.max_size:
+                break
+            shutil.rmtree(self._entry_path(key), ignore_errors=True)
+            total_size -= size
+
+    def clear(self):
+        """Remove all cached entries."""
+        for key, _, _ in self.entries():
+            shutil.rmtree(self._entry_path(key), ignore_errors=True)
+
+
+# The cache used by read_root
+metadata_cache = MetadataCache()
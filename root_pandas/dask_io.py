@@ -0,0 +1,84 @@
+"""
+Reading ROOT files into a dask DataFrame, with one partition per work unit of `plan_chunks`.
+
+The metadata of the DataFrame is taken from the types of the branches by reading
+no entries (only the first one when flattening, see `root_pandas.planning.get_meta`),
+and the divisions are known: they are the global entry numbers of the
+units, or the values of the `__index__*` branch if it is sorted.
+"""
+import numpy as np
+from root_numpy import root2array
+
+try:
+    import dask.dataframe as dd
+except ImportError:
+    dd = None
+
+from .planning import get_meta, plan_chunks, read_chunk
+
+
+__all__ = [
+    'get_divisions',
+    'read_root_dask',
+]
+
+
+def _index_bounds(unit, branch):
+    """Return the first and last value of the index of a unit, and whether it is sorted"""
+    values = root2array(unit.path, unit.key, [branch], start=unit.start, stop=unit.stop, **unit.kwargs)[branch]
+    return values[0].item(), values[-1].item(), bool(np.all(values[1:] >= values[:-1]))
+
+
+def get_divisions(units):
+    """Return the divisions of the partitions reading `units`, or None if they are unknown.
+
+    Without an `__index__*` branch, rows are indexed by their global entry number, so the
+    divisions follow from the entry ranges. Otherwise only the index branch is read, and the
+    divisions are known if it increases over all units.
+    """
+    if not units:
+        return None
+    index_branches = [branch for branch in units[0].branches if branch.startswith('__index__')]
+    if not index_branches:
+        last = units[-1]
+        return tuple(unit.entry for unit in units) + (last.entry + last.n_entries - 1,)
+    bounds = [_index_bounds(unit, index_branches[0]) for unit in units]
+    if not all(is_sorted for _, _, is_sorted in bounds):
+        return None
+    if any(previous[1] >= following[0] for previous, following in zip(bounds, bounds[1:])):
+        return None
+    return tuple(first for first, _, _ in bounds) + (bounds[-1][1],)
+
+
+def read_root_dask(paths, key=None, columns=None, chunksize=None, known_divisions=True, **kwargs):
+    """Read ROOT files into a dask DataFrame with one partition per range of entries.
+
+    Further keyword arguments, such as `where`, `flatten`, `query`, `ignore`, `chunk_memory`
+    or `jagged`, are passed to `root_pandas.planning.plan_chunks`.
+
+    Parameters
+    ----------
+    paths: string or list
+        The path(s) to the root file(s)
+    key: string
+        The key of the tree to load.
+    columns: str or sequence of str
+        Shell-patterns of the columns to read, see read_root
+    chunksize: int (optional, default: None)
+        The maximum number of entries of a partition. By default every file is a partition.
+    known_divisions: bool (optional, default: True)
+        Whether to determine the divisions. With an `__index__*` branch, this reads that branch.
+
+    Returns
+    -------
+        dask.dataframe.DataFrame
+    """
+    if dd is None:
+        raise ImportError('read_root_dask requires dask[dataframe]')
+    units = plan_chunks(paths, key, columns=columns, chunksize=chunksize, **kwargs)
+    if not units:
+        raise ValueError('No entries found in any of the given paths')
+    meta = get_meta(units[0])
+    divisions = get_divisions(units) if known_divisions else None
+    return dd.from_map(read_chunk, units, meta=meta, divisions=divisions, label='read-root',
+                       enforce_metadata=False)
@@ -0,0 +1,191 @@
+"""
+Statistics about the I/O and conversions done by read_root and to_root.
+"""
+from contextlib import contextmanager
+import threading
+import time
+
+import ROOT
+
+
+__all__ = [
+    'IOStats',
+]
+
+
+def get_bytes_read():
+    """Return the number of bytes read from all ROOT files by this process so far."""
+    return ROOT.TFile.GetFileBytesRead()
+
+
+def get_bytes_written():
+    """Return the number of bytes written to all ROOT files by this process so far."""
+    return ROOT.TFile.GetFileBytesWritten()
+
+
+class IOStats(object):
+    """Counters filled by read_root, to_root and RootWriter when passed as their `stats` argument.
+
+    Bytes are counted with ROOT's global TFile counters, so they only include the
+    bytes read and written by the current process, and not those of worker processes
+    reading files in parallel. Timings are exclusive: the time spent in a stage nested
+    in another one, such as 'categorical' within 'convert', is only counted once.
+    Measuring costs a few microseconds per stage and chunk, so it can be left enabled.
+
+    Parameters
+    ----------
+    on_chunk: callable (optional, default: None)
+        Called with a dict describing every chunk after it has been read and converted,
+        or written, see `record_chunk`
+    keep_chunks: bool (optional, default: False)
+        Whether to keep the dicts describing the chunks in `chunks`; they are only passed
+        to `on_chunk` by default, so that long reads don't accumulate them in memory
+
+    Attributes
+    ----------
+    bytes_read: int
+        The number of bytes read from the files
+    bytes_written: int
+        The number of bytes written to the files
+    bytes_decompressed: int
+        The size of the arrays returned by root_numpy, which is about the uncompressed size of the data read
+    entries_selected: int
+        The number of entries passing the `where` selection (only counted with pushdown)
+    entries_read: int
+        The number of entries whose columns were read
+    entries_skipped: int
+        The number of entries whose columns didn't need to be read
+    entries_written: int
+        The number of entries written to trees
+    clusters_read: int
+        The number of clusters whose columns were read (only counted with pushdown)
+    clusters_skipped: int
+        The number of clusters without any selected entry (only counted with pushdown)
+    peak_chunk_bytes: int
+        The size of the largest chunk, including the array it was converted from when reading
+    n_chunks: int
+        The number of chunks read or written
+    timings: dict
+        The wall time in seconds spent in each stage, such as 'metadata', 'select', 'read',
+        'flatten', 'convert' and 'categorical' when reading, or 'prepare', 'fill', 'flush'
+        and 'write' when writing
+    chunks: list of dict
+        The statistics of every chunk if `keep_chunks` is set, see `record_chunk`
+    """
+
+    COUNTERS = (
+        'bytes_read', 'bytes_written', 'bytes_decompressed', 'entries_selected', 'entries_read',
+        'entries_skipped', 'entries_written', 'clusters_read', 'clusters_skipped',
+    )
+
+    def __init__(self, on_chunk=None, keep_chunks=False):
+        self.on_chunk = on_chunk
+        self.keep_chunks = keep_chunks
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        """Set all counters to zero."""
+        with self._lock:
+            for name in self.COUNTERS:
+                setattr(self, name, 0)
+            self.peak_chunk_bytes = 0
+            self.n_chunks = 0
+            self.timings = {}
+            self.chunks = []
+            self._last_chunk = self._snapshot()
+
+    @property
+    def wall_time(self):
+        """The total time spent in all stages"""
+        return sum(self.timings.values())
+
+    @contextmanager
+    def measure(self, stage):
+        """Add the time taken and bytes read and written within the context to `stage`."""
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        # The time spent in nested stages, which is subtracted from this one
+        nested = [0.]
+        stack.append(nested)
+        outermost = len(stack) == 1
+        if outermost:
+            bytes_read_before = get_bytes_read()
+            bytes_written_before = get_bytes_written()
+        start = time.time()
+        try:
+            yield self
+        finally:
+            elapsed = time.time() - start
+            stack.pop()
+            if stack:
+                stack[-1][0] += elapsed
+            with self._lock:
+                self.timings[stage] = self.timings.get(stage, 0) + elapsed - nested[0]
+                if outermost:
+                    self.bytes_read += get_bytes_read() - bytes_read_before
+                    self.bytes_written += get_bytes_written() - bytes_written_before
+
+    def _snapshot(self):
+        snapshot = dict((name, getattr(self, name)) for name in self.COUNTERS)
+        snapshot['timings'] = dict(self.timings)
+        return snapshot
+
+    def record_chunk(self, rows, nbytes):
+        """Record that a chunk was completed and pass its statistics to `on_chunk`.
+
+        The statistics of a chunk are a dict of its number `index`, its number of `rows`, its size
+        `nbytes` and the increase of all counters and timings since the previous chunk.
+        """
+        with self._lock:
+            snapshot = self._snapshot()
+            chunk = dict((name, snapshot[name] - self._last_chunk[name]) for name in self.COUNTERS)
+            chunk['timings'] = dict((stage, elapsed - self._last_chunk['timings'].get(stage, 0))
+                                    for stage, elapsed in snapshot['timings'].items())
+            chunk.update(index=self.n_chunks, rows=rows, nbytes=nbytes)
+            self._last_chunk = snapshot
+            self.n_chunks += 1
+            self.peak_chunk_bytes = max(self.peak_chunk_bytes, nbytes)
+            if self.keep_chunks:
+                self.chunks.append(chunk)
+        if self.on_chunk is not None:
+            self.on_chunk(chunk)
+        return chunk
+
+    def merge(self, counters):
+        """Add the counters of another IOStats, as returned by its `as_dict`, such as from a worker process."""
+        with self._lock:
+            for name in self.COUNTERS:
+                setattr(self, name, getattr(self, name) + counters.get(name, 0))
+            for stage, elapsed in counters.get('timings', {}).items():
+                self.timings[stage] = self.timings.get(stage, 0) + elapsed
+            self.n_chunks += counters.get('n_chunks', 0)
+            self.peak_chunk_bytes = max(self.peak_chunk_bytes, counters.get('peak_chunk_bytes', 0))
+            self._last_chunk = self._snapshot()
+
+    def as_dict(self):
+        """Return all counters as a dictionary."""
+        with self._lock:
+            result = dict((name, getattr(self, name)) for name in self.COUNTERS)
+            result.update(
+                peak_chunk_bytes=self.peak_chunk_bytes,
+                n_chunks=self.n_chunks,
+                timings=dict(self.timings),
+                wall_time=self.wall_time,
+            )
+        return result
+
+    def __repr__(self):
+        return 'IOStats({})'.format(', '.join('{}={!r}'.format(k, v) for k, v in sorted(self.as_dict().items())))
+
+
+@contextmanager
+def measure(stats, stage):
+    """Measure `stage` if `stats` is not None."""
+    if stats is None:
+        yield None
+    else:
+        with stats.measure(stage):
+            yield stats
@@ -0,0 +1,294 @@
+"""
+A pandas extension array for columns of variable-length arrays.
+
+The values of all rows are stored in a single contiguous content array and
+row ``i`` is ``content[offsets[i]:offsets[i+1]]``.
+"""
+import numbers
+
+import numpy as np
+import pandas as pd
+from pandas.api.extensions import ExtensionArray, ExtensionDtype
+from pandas.api.extensions import register_extension_dtype, register_series_accessor
+
+from root_numpy.extern.six import string_types
+
+from .utils import array_lengths, lengths_to_offsets
+
+
+__all__ = [
+    'JaggedArray',
+    'JaggedDtype',
+]
+
+
+@register_extension_dtype
+class JaggedDtype(ExtensionDtype):
+    """The dtype of a JaggedArray, parametrised by the dtype of its elements."""
+    type = np.ndarray
+    kind = 'O'
+    na_value = None
+    _metadata = ('subtype',)
+
+    def __init__(self, subtype=np.float64):
+        self.subtype = np.dtype(subtype)
+
+    @property
+    def name(self):
+        return 'jagged[{}]'.format(self.subtype.name)
+
+    @classmethod
+    def construct_from_string(cls, string):
+        if not isinstance(string, string_types) or not (string.startswith('jagged[') and string.endswith(']')):
+            raise TypeError("Cannot construct a 'JaggedDtype' from '{}'".format(string))
+        return cls(string[len('jagged['):-1])
+
+    @classmethod
+    def construct_array_type(cls):
+        return JaggedArray
+
+
+def _is_missing(value):
+    """Whether a row is None or a scalar NA value, such as the rows added by Series.shift"""
+    return value is None or (np.ndim(value) == 0 and bool(pd.isna(value)))
+
+
+class JaggedArray(ExtensionArray):
+    """A column of variable-length arrays backed by a content and an offsets array.
+
+    Missing values are not supported: rows which would be missing, such as those added by
+    `Series.shift` or `reindex`, are empty arrays. Rows are compared with `==` as a whole,
+    and `unique`, `factorize` and grouping by a column compare the elements of the rows.
+
+    Parameters
+    ----------
+    content: ndarray
+        The values of all rows, concatenated along the first axis
+    offsets: ndarray
+        Increasing int64 array with one more element than there are rows
+    """
+
+    def __init__(self, content, offsets):
+        self._content = np.asarray(content)
+        self._offsets = np.asarray(offsets, dtype=np.int64)
+        if self._offsets.ndim != 1 or len(self._offsets) == 0:
+            raise ValueError('offsets must be a non-empty one dimensional array')
+
+    @classmethod
+    def from_objects(cls, values, dtype=None):
+        """Create a JaggedArray from a sequence of arrays, such as an object column returned by root_numpy.
+
+        Missing values (None or NA) become empty arrays.
+        """
+        if any(_is_missing(x) for x in values):
+            values = [() if _is_missing(x) else x for x in values]
+        lengths = array_lengths(values)
+        if len(values) and lengths.sum():
+            content = np.concatenate([np.asarray(x) for x in values])
+        else:
+            content = np.empty(0, dtype=dtype if dtype is not None else np.float64)
+        if dtype is not None:
+            content = content.astype(dtype, copy=False)
+        return cls(content, lengths_to_offsets(lengths))
+
+    @classmethod
+    def from_regular(cls, values):
+        """Create a JaggedArray from a (n, k, ...) array where every row has k elements."""
+        values = np.asarray(values)
+        n_rows, length = values.shape[:2]
+        content = np.ascontiguousarray(values).reshape((n_rows * length,) + values.shape[2:])
+        return cls(content, np.arange(n_rows + 1, dtype=np.int64) * length)
+
+    @classmethod
+    def _from_sequence(cls, scalars, dtype=None, copy=False):
+        if isinstance(scalars, cls):
+            return scalars.copy() if copy else scalars
+        if isinstance(dtype, JaggedDtype):
+            dtype = dtype.subtype
+        return cls.from_objects(scalars, dtype=dtype)
+
+    @classmethod
+    def _concat_same_type(cls, to_concat):
+        to_concat = list(to_concat)
+        content = np.concatenate([x.flatten() for x in to_concat])
+        lengths = np.concatenate([x.lengths for x in to_concat])
+        return cls(content, lengths_to_offsets(lengths))
+
+    @property
+    def dtype(self):
+        return JaggedDtype(self._content.dtype)
+
+    @property
+    def nbytes(self):
+        return self._content.nbytes + self._offsets.nbytes
+
+    @property
+    def offsets(self):
+        return self._offsets
+
+    @property
+    def lengths(self):
+        """The number of elements in each row"""
+        return np.diff(self._offsets)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, item):
+        if isinstance(item, numbers.Integral):
+            if item < 0:
+                item += len(self)
+            if not 0 <= item < len(self):
+                raise IndexError('index {} is out of bounds for JaggedArray of length {}'.format(item, len(self)))
+            return self._content[self._offsets[item]:self._offsets[item + 1]]
+        if isinstance(item, slice) and item.step in (None, 1):
+            start, stop, _ = item.indices(len(self))
+            stop = max(start, stop)
+            # Share the content with the original array
+            return type(self)(self._content, self._offsets[start:stop + 1])
+        if not isinstance(item, slice):
+            item = np.asarray(item)
+        return self.take(np.arange(len(self))[item])
+
+    def take(self, indices, allow_fill=False, fill_value=None):
+        # Missing rows are always filled with empty arrays
+        indices = np.asarray(indices, dtype=np.int64)
+        if allow_fill:
+            missing = indices == -1
+            if np.any(indices < -1):
+                raise ValueError('Invalid value in indices for take with allow_fill=True')
+            indices = np.where(missing, 0, indices)
+        else:
+            indices = np.where(indices < 0, indices + len(self), indices)
+        if len(indices) and (indices.min() < 0 or indices.max() >= len(self)):
+            raise IndexError('indices are out of bounds for JaggedArray of length {}'.format(len(self)))
+        lengths = self.lengths[indices]
+        if allow_fill:
+            lengths[missing] = 0
+        offsets = lengths_to_offsets(lengths)
+        # The position in the content of every element of the selected rows
+        positions = np.arange(offsets[-1]) + np.repeat(self._offsets[:-1][indices] - offsets[:-1], lengths)
+        return type(self)(self._content[positions], offsets)
+
+    def copy(self):
+        return type(self)(self.flatten().copy(), self._offsets - self._offsets[0])
+
+    def __eq__(self, other):
+        """Return whether every row has the same elements as the same row of other, a sequence of arrays"""
+        if isinstance(other, (pd.Series, pd.Index, pd.DataFrame)):
+            # Let pandas unpack them and call this again
+            return NotImplemented
+        if not isinstance(other, JaggedArray):
+            other = JaggedArray.from_objects(other)
+        if len(other) != len(self):
+            raise ValueError('Lengths must match to compare: {} and {}'.format(len(self), len(other)))
+        result = self.lengths == other.lengths
+        rows = np.flatnonzero(result)
+        left, right = self.take(rows), other.take(rows)
+        unequal = left.flatten() != right.flatten()
+        if unequal.ndim > 1:
+            unequal = unequal.reshape(len(unequal), -1).any(axis=1)
+        # Rows with any unequal element
+        result[rows[np.repeat(np.arange(len(rows)), left.lengths)[unequal]]] = False
+        return result
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return ~result
+
+    def _values_for_factorize(self):
+        # Rows are hashed by their shape and the bytes of their elements
+        values = np.empty(len(self), dtype='O')
+        for i in range(len(self)):
+            row = np.ascontiguousarray(self[i])
+            values[i] = (row.shape, row.tobytes())
+        return values, None
+
+    def _values_for_argsort(self):
+        # Rows are sorted lexicographically
+        values = np.empty(len(self), dtype='O')
+        for i in range(len(self)):
+            values[i] = tuple(self[i].tolist())
+        return values
+
+    @classmethod
+    def _from_factorized(cls, values, original):
+        subtype = original.dtype.subtype
+        return cls.from_objects([np.frombuffer(data, dtype=subtype).reshape(shape) for shape, data in values],
+                                dtype=subtype)
+
+    def unique(self):
+        return self.factorize()[1]
+
+    def duplicated(self, keep='first'):
+        return pd.Index(self.factorize()[0]).duplicated(keep=keep)
+
+    def value_counts(self, dropna=True):
+        codes, uniques = self.factorize()
+        return pd.Series(np.bincount(codes, minlength=len(uniques)), index=pd.Index(uniques), name='count')
+
+    def _groupby_op(self, how=None, ngroups=None, ids=None, **kwargs):
+        # Used by pandas >= 2.1, whose generic implementation requires scalar values
+        if how not in ('first', 'last'):
+            return super(JaggedArray, self)._groupby_op(how=how, ngroups=ngroups, ids=ids, **kwargs)
+        positions = np.flatnonzero(ids >= 0)
+        if how == 'first':
+            # The last assignment wins, so assign the rows in reversed order
+            positions = positions[::-1]
+        rows = np.full(ngroups, -1, dtype=np.int64)
+        rows[ids[positions]] = positions
+        return self.take(rows, allow_fill=True)
+
+    def isna(self):
+        return np.zeros(len(self), dtype=bool)
+
+    def flatten(self):
+        """Return the elements of all rows as a single array, without copying"""
+        return self._content[self._offsets[0]:self._offsets[-1]]
+
+    def element(self, i):
+        """Return the i-th element of every row, raising an IndexError if a row is too short"""
+        if i >= 0:
+            positions = self._offsets[:-1] + i
+            valid = positions < self._offsets[1:]
+        else:
+            positions = self._offsets[1:] + i
+            valid = positions >= self._offsets[:-1]
+        if not np.all(valid):
+            raise IndexError('index {} is out of bounds for some rows'.format(i))
+        return self._content[positions]
+
+    def to_objects(self):
+        """Convert into an object array of arrays, as returned by root_numpy"""
+        result = np.empty(len(self), dtype='O')
+        for i in range(len(self)):
+            result[i] = self[i]
+        return result
+
+    def __array__(self, dtype=None, copy=None):
+        return self.to_objects()
+
+
+@register_series_accessor('jagged')
+class JaggedAccessor(object):
+    """Vectorised operations on Series of JaggedArray, available as ``series.jagged``."""
+
+    def __init__(self, series):
+        if not isinstance(series.array, JaggedArray):
+            raise AttributeError('Can only use .jagged accessor with JaggedArray values')
+        self._series = series
+        self._array = series.array
+
+    @property
+    def lengths(self):
+        return pd.Series(self._array.lengths, index=self._series.index, name=self._series.name)
+
+    def element(self, i):
+        return pd.Series(self._array.element(i), index=self._series.index, name=self._series.name)
+
+    def flatten(self):
+        """Return all elements, with the index of each element's row"""
+        index = self._series.index.repeat(self._array.lengths)
+        return pd.Series(self._array.flatten(), index=index, name=self._series.name)
@@ -0,0 +1,126 @@
+"""
+A DataFrame-like proxy returned by ``read_root(..., lazy=True)``.
+
+Only the names of the columns are known when it is created. Every column is read
+from the files the first time it is accessed and then kept in memory, so that
+touching a few columns of a tree with thousands of branches only reads those.
+"""
+import pandas as pd
+
+from root_numpy.extern.six import string_types
+
+
+__all__ = [
+    'LazyFrame',
+]
+
+
+class LazyFrame(object):
+    """A DataFrame whose columns are read on first access.
+
+    Parameters
+    ----------
+    columns: sequence of str
+        The names of the columns
+    load: callable
+        Called with a list of column names, returns a DataFrame containing these columns
+        (and the index). All calls must return the same rows.
+    n_rows: int (optional, default: None)
+        The number of rows, if it is known without reading any column
+
+    Notes
+    -----
+
+        >>> frame = read_root('ntuple.root', lazy=True)
+        >>> frame['pt'].mean()  # only reads the pt branch
+        >>> df = frame[['pt', 'eta']]  # a DataFrame of two columns
+        >>> df = frame.to_dataframe()  # a DataFrame of the columns read so far, pt and eta
+        >>> df = frame.to_dataframe(frame.columns)  # reads all remaining branches
+    """
+
+    def __init__(self, columns, load, n_rows=None):
+        self._columns = list(columns)
+        self._load = load
+        self._n_rows = n_rows
+        self._loaded = {}
+        self._index = None
+
+    @property
+    def columns(self):
+        """The names of all columns, as a pandas.Index"""
+        return pd.Index(self._columns)
+
+    @property
+    def loaded(self):
+        """The names of the columns which have already been read"""
+        return [name for name in self._columns if name in self._loaded]
+
+    @property
+    def index(self):
+        """The index, which requires reading one column if none was read yet"""
+        if self._index is None:
+            self.load(self._columns[:1])
+        return self._index
+
+    @property
+    def shape(self):
+        return len(self), len(self._columns)
+
+    def __len__(self):
+        """The number of rows, which requires reading one column if it isn't known yet"""
+        if self._n_rows is None:
+            self._n_rows = len(self.index)
+        return self._n_rows
+
+    def __contains__(self, name):
+        return name in self._columns
+
+    def __iter__(self):
+        return iter(self._columns)
+
+    def load(self, columns):
+        """Read the columns which haven't been read yet in a single pass."""
+        columns = list(columns)
+        unknown = [name for name in columns if name not in self._columns]
+        if unknown:
+            raise KeyError('Unknown columns: {}'.format(', '.join(map(str, unknown))))
+        missing = [name for name in columns if name not in self._loaded]
+        if not missing and self._index is not None:
+            return
+        # The index is read with the first column if no column is requested
+        df = self._load(missing or self._columns[:1])
+        if self._n_rows is not None and len(df.index) != self._n_rows:
+            raise RuntimeError('The number of rows changed between reads, were the files modified?')
+        if self._index is None:
+            self._index = df.index
+        elif len(df.index) != len(self._index):
+            raise RuntimeError('The number of rows changed between reads, were the files modified?')
+        for name in missing:
+            self._loaded[name] = df[name]
+
+    def __getitem__(self, key):
+        if isinstance(key, string_types):
+            self.load([key])
+            return self._loaded[key]
+        return self.to_dataframe(list(key))
+
+    def __getattr__(self, name):
+        # Called only for attributes which aren't found otherwise, allows frame.column
+        if not name.startswith('_') and name in self.__dict__.get('_columns', ()):
+            return self[name]
+        raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, name))
+
+    def to_dataframe(self, columns=None):
+        """Return a DataFrame of the columns, reading the missing ones.
+
+        By default, only the columns which have already been read are returned, so that
+        materialising the frame doesn't read the branches which were never accessed.
+        """
+        columns = self.loaded if columns is None else list(columns)
+        self.load(columns)
+        return pd.DataFrame(dict((name, self._loaded[name].values) for name in columns), index=self._index,
+                            columns=columns, copy=False)
+
+    def __repr__(self):
+        return '<LazyFrame: {} columns, {} loaded: {}>'.format(
+            len(self._columns), len(self._loaded), ', '.join(map(str, self.loaded)) or '-')
@@ -0,0 +1,229 @@
+"""
+Planning of reads as independent work units, for distributing them with any executor.
+
+`plan_chunks` does the part of read_root which needs to see all files: finding the
+entries and clusters of every file, resolving the branches and splitting the
+entries into balanced chunks. It returns picklable work units which `read_chunk`
+reads independently of each other, in any process or on any node:
+
+    >>> units = plan_chunks(paths, 'tree', columns=['pt', 'eta'], chunksize=100000, where='pt > 20')
+    >>> with multiprocessing.Pool(8) as pool:
+    ...     df = pd.concat(pool.map(read_chunk, units))
+"""
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+from root_numpy import root2array
+
+from .cache import parse_size
+from .query import Query
+from .readwrite import (_find_tree, _get_branch_sizes, _get_executor, _get_segments, _list_branches,
+                        _resolve_branches, _scan_files, convert_to_dataframe, do_flatten, estimate_entry_size,
+                        expand_paths, get_chunk_ranges, get_memory_chunk_ranges)
+
+
+__all__ = [
+    'ChunkUnit',
+    'get_meta',
+    'plan_chunks',
+    'read_chunk',
+]
+
+
+# The formula returning the number of every entry within its file
+ENTRY_FORMULA = 'Entry$'
+
+
+class ChunkUnit(namedtuple('ChunkUnit', ['path', 'key', 'start', 'stop', 'entry', 'branches', 'where',
+                                         'flatten', 'query', 'drop', 'jagged', 'kwargs'])):
+    """A range of entries of a single file to read with `read_chunk`.
+
+    Attributes
+    ----------
+    path: str
+        The path of the file
+    key: str
+        The key of the tree
+    start, stop: int
+        The range of entries within the file
+    entry: int
+        The number of the entry `start` counted over all files of the plan
+    branches: list of str
+        The resolved branches and formulas to read
+    where: str or None
+        The selection passed to root_numpy
+    flatten: sequence of str or False
+        The columns to flatten
+    query: str or None
+        The expression of the `root_pandas.query.Query` to apply after flattening
+    drop: list of str
+        The branches which were only read for the query
+    jagged: {None, 'offsets'}
+        How columns of arrays are returned, see read_root
+    kwargs: dict
+        Further arguments of root2array
+    """
+    __slots__ = ()
+
+    @property
+    def n_entries(self):
+        return self.stop - self.start
+
+
+def plan_chunks(paths, key=None, columns=None, ignore=None, chunksize=None, where=None, flatten=False,
+                query=None, chunk_align='cluster', chunk_memory=None, jagged=None, n_workers=None,
+                executor=None, **kwargs):
+    """Split the entries of ROOT files into independent work units which can be read with `read_chunk`.
+
+    The options have the same meaning as for read_root. Units never span several files, so
+    a chunk spanning files (with `chunk_align='entries'`) is split into one unit per file.
+
+    Parameters
+    ----------
+    paths: string or list
+        The path(s) to the root file(s)
+    key: string
+        The key of the tree to load.
+    columns: str or sequence of str
+        Shell-patterns of the columns to read, see read_root
+    ignore: str or sequence of str
+        Shell-patterns of the columns to ignore
+    chunksize: int (optional, default: None)
+        The maximum number of entries of a unit. By default every file is a single unit.
+    where: str
+        Only rows that match the expression will be read.
+    flatten: sequence of str
+        The columns of arrays to flatten
+    query: str
+        A pandas-style expression applied after reading, see read_root
+    chunk_align: {'cluster', 'entries'}
+        How chunk boundaries are chosen, see read_root
+    chunk_memory: int or str (optional, default: None)
+        The maximum estimated size of a unit in memory, such as '512MB', see read_root
+    jagged: {None, 'offsets'}
+        How columns of arrays are returned, see read_root
+    n_workers: int
+        The number of processes in which the files are scanned
+    executor: object
+        An existing executor to scan the files with
+
+    Returns
+    -------
+        A list of `ChunkUnit`, in the order of the entries
+    """
+    paths = expand_paths(paths)
+    if not paths:
+        raise OSError('No trees found in any of the given paths')
+    if not key:
+        key = _find_tree(paths[0])
+    if chunk_align not in ('cluster', 'entries'):
+        raise ValueError('Unknown chunk_align: {}. Must be "cluster" or "entries".'.format(chunk_align))
+    if jagged not in (None, 'offsets'):
+        raise ValueError('Unknown jagged: {}. Must be None or "offsets".'.format(jagged))
+
+    with _get_executor(n_workers, executor) as executor_:
+        file_entries, boundaries, missing = _scan_files(paths, key, executor_)
+    paths = [path for path in paths if path not in set(missing)]
+    if not paths:
+        raise OSError('{} not found in any of the given paths'.format(key))
+    branches = _list_branches(paths[0], key)
+    all_vars, _, query, query_vars = _resolve_branches(branches, columns, ignore, query)
+
+    whole_clusters = chunk_align == 'cluster'
+    if chunk_memory is not None:
+        entry_sizes = [estimate_entry_size(_get_branch_sizes(path, key), all_vars, flatten) if n_entries else 0
+                       for path, n_entries in file_entries]
+        ranges = get_memory_chunk_ranges(boundaries, file_entries, entry_sizes, parse_size(chunk_memory),
+                                         chunksize, whole_clusters=whole_clusters)
+    elif chunksize:
+        ranges = get_chunk_ranges(boundaries, chunksize, whole_clusters=whole_clusters, file_entries=file_entries)
+    else:
+        ranges = [(boundaries[0], boundaries[-1])]
+
+    units = []
+    for start, stop in ranges:
+        entry = start
+        for path, low, high in _get_segments(file_entries, start, stop):
+            if high > low:
+                units.append(ChunkUnit(
+                    path, key, int(low), int(high), int(entry), list(all_vars), where, flatten,
+                    query.expression if query is not None else None, query_vars, jagged, kwargs))
+            entry += high - low
+    return units
+
+
+def read_chunk(unit):
+    """Read a unit returned by `plan_chunks` into a DataFrame.
+
+    If the tree has no `__index__*` branch, the index contains the number of the entry
+    (counted over all files of the plan) of every row, so that concatenating all units
+    without any selection gives the same DataFrame as read_root, and with a selection
+    every row keeps the number of its entry.
+
+    Parameters
+    ----------
+    unit: ChunkUnit
+        The unit to read
+
+    Returns
+    -------
+        DataFrame
+    """
+    branches, with_entries = _get_branches(unit)
+    arr = root2array(unit.path, unit.key, branches, selection=unit.where, start=unit.start, stop=unit.stop,
+                     **unit.kwargs)
+    if len(arr) == 0:
+        # The types of flattened columns are unknown without any entry
+        return get_meta(unit)
+    if unit.flatten:
+        arr = do_flatten(arr, unit.flatten)
+    if unit.query is not None:
+        arr = arr[Query(unit.query).mask(arr)]
+    return _convert(unit, arr, with_entries)
+
+
+def get_meta(unit):
+    """Return an empty DataFrame with the columns and types of the DataFrames returned by `read_chunk`.
+
+    No entries are read, except the first entry of the unit if columns are flattened or
+    jagged is given, since the types of the elements of variable-length arrays are only
+    known from the arrays.
+
+    Parameters
+    ----------
+    unit: ChunkUnit
+        A unit returned by `plan_chunks`
+
+    Returns
+    -------
+        DataFrame
+    """
+    branches, with_entries = _get_branches(unit)
+    stop = unit.start + 1 if unit.flatten or unit.jagged else unit.start
+    arr = root2array(unit.path, unit.key, branches, start=unit.start, stop=stop, **unit.kwargs)
+    if unit.flatten:
+        arr = do_flatten(arr, unit.flatten)
+    return _convert(unit, arr, with_entries).iloc[:0]
+
+
+def _get_branches(unit):
+    """Return the branches to read for a unit and whether the number of the entries is read as well"""
+    branches = list(unit.branches)
+    has_index = any(branch.startswith('__index__') for branch in branches)
+    # The rows don't match consecutive entries if some are removed or flattened
+    with_entries = not has_index and bool(unit.where or unit.flatten or unit.query)
+    if with_entries:
+        branches.append(ENTRY_FORMULA)
+    return branches, with_entries
+
+
+def _convert(unit, arr, with_entries):
+    """Convert the array read for a unit, removing the branches only read for the query"""
+    names = [name for name in arr.dtype.names if name not in unit.drop and name != ENTRY_FORMULA]
+    if not with_entries:
+        if unit.drop:
+            arr = arr[names]
+        return convert_to_dataframe(arr, start_index=unit.entry, jagged=unit.jagged)
+    columns = OrderedDict((name, arr[name]) for name in names)
+    columns['__index__'] = arr[ENTRY_FORMULA].astype(np.int64) + (unit.entry - unit.start)
+    return convert_to_dataframe(columns, jagged=unit.jagged)
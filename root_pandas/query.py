@@ -0,0 +1,185 @@
+"""
+Pandas-style query expressions evaluated on numpy arrays.
+
+An expression such as ``(pt > 20) & (abs(eta) < 2.5)`` is parsed once, the
+branches it uses are determined from it and it is then evaluated on whole
+arrays with numexpr if it is installed, and numpy otherwise.
+"""
+import ast
+import numbers
+import tokenize
+
+import numpy as np
+
+from root_numpy.extern.six import string_types
+from root_numpy.extern.six.moves import StringIO
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+
+__all__ = [
+    'Query',
+]
+
+# Functions supported by both numpy and numexpr
+NUMEXPR_FUNCTIONS = frozenset([
+    'abs', 'arccos', 'arccosh', 'arcsin', 'arcsinh', 'arctan', 'arctan2', 'arctanh', 'cos', 'cosh',
+    'exp', 'expm1', 'log', 'log10', 'log1p', 'sin', 'sinh', 'sqrt', 'tan', 'tanh', 'where',
+])
+# Functions only evaluated with numpy
+NUMPY_FUNCTIONS = frozenset([
+    'ceil', 'floor', 'hypot', 'isfinite', 'isinf', 'isnan', 'maximum', 'minimum', 'sign',
+])
+
+_BINARY_OPERATORS = {
+    ast.Add: '+', ast.Sub: '-', ast.Mult: '*', ast.Div: '/', ast.FloorDiv: '//', ast.Mod: '%',
+    ast.Pow: '**', ast.BitAnd: '&', ast.BitOr: '|', ast.BitXor: '^',
+}
+_COMPARE_OPERATORS = {
+    ast.Eq: '==', ast.NotEq: '!=', ast.Lt: '<', ast.LtE: '<=', ast.Gt: '>', ast.GtE: '>=',
+}
+_CONSTANT_NODES = tuple(getattr(ast, name) for name in ('Constant', 'Num', 'NameConstant') if hasattr(ast, name))
+
+
+def _replace_booleans(expression):
+    """Replace `&` and `|` by `and` and `or`, which gives them a lower precedence than
+    comparisons like in `DataFrame.query`, so that `a > 1 & b < 2` means `(a > 1) & (b < 2)`"""
+    tokens = []
+    for token in tokenize.generate_tokens(StringIO(expression).readline):
+        if token[0] == tokenize.OP and token[1] == '&':
+            tokens.append((tokenize.NAME, 'and'))
+        elif token[0] == tokenize.OP and token[1] == '|':
+            tokens.append((tokenize.NAME, 'or'))
+        else:
+            tokens.append(token[:2])
+    return tokenize.untokenize(tokens)
+
+
+def _constant_value(node):
+    for field in ('value', 'n'):
+        if hasattr(node, field):
+            return getattr(node, field)
+    raise ValueError('Unsupported constant in query')
+
+
+class Query(object):
+    """A compiled query expression.
+
+    Parameters
+    ----------
+    expression: str
+        The expression, using the syntax of `DataFrame.query`. Supported are arithmetic,
+        comparisons (including chained ones and `in` with a list of constants), `&`, `|`,
+        `~`, `and`, `or`, `not` and the functions in NUMEXPR_FUNCTIONS and NUMPY_FUNCTIONS.
+        Like in pandas, `&` and `|` are the same as `and` and `or` and bind less tightly
+        than comparisons.
+    """
+
+    def __init__(self, expression):
+        if not isinstance(expression, string_types):
+            raise TypeError('query must be a string, not {}'.format(type(expression).__name__))
+        self.expression = expression
+        self.names = []
+        self._use_numexpr = numexpr is not None
+        try:
+            tree = ast.parse(_replace_booleans(expression.strip()), mode='eval')
+        except (SyntaxError, tokenize.TokenError) as e:
+            raise ValueError('Invalid query {!r}: {}'.format(expression, e))
+        self.source = self._translate(tree.body)
+        self._code = compile(self.source, '<query>', 'eval')
+
+    def _translate(self, node):
+        """Return the fully parenthesised source of node, checking that it is supported"""
+        if isinstance(node, ast.Name):
+            if node.id in ('True', 'False'):
+                return node.id
+            if node.id not in self.names:
+                self.names.append(node.id)
+            return node.id
+        if isinstance(node, _CONSTANT_NODES):
+            value = _constant_value(node)
+            if not isinstance(value, numbers.Real):
+                raise ValueError('Unsupported constant {!r} in query {!r}'.format(value, self.expression))
+            return repr(value)
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+            if isinstance(node.op, ast.FloorDiv):
+                self._use_numexpr = False
+            return '({} {} {})'.format(self._translate(node.left), _BINARY_OPERATORS[type(node.op)],
+                                       self._translate(node.right))
+        if isinstance(node, ast.UnaryOp):
+            operand = self._translate(node.operand)
+            if isinstance(node.op, (ast.Invert, ast.Not)):
+                return '(~{})'.format(operand)
+            if isinstance(node.op, ast.USub):
+                return '(-{})'.format(operand)
+            if isinstance(node.op, ast.UAdd):
+                return operand
+        if isinstance(node, ast.BoolOp):
+            operator = ' & ' if isinstance(node.op, ast.And) else ' | '
+            return '({})'.format(operator.join(self._translate(value) for value in node.values))
+        if isinstance(node, ast.Compare):
+            comparisons = []
+            left = node.left
+            for op, right in zip(node.ops, node.comparators):
+                comparisons.append(self._translate_comparison(left, op, right))
+                left = right
+            if len(comparisons) == 1:
+                return comparisons[0]
+            return '({})'.format(' & '.join(comparisons))
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not getattr(node, 'keywords', None):
+            name = node.func.id
+            if name not in NUMEXPR_FUNCTIONS and name not in NUMPY_FUNCTIONS:
+                raise ValueError('Unsupported function {!r} in query {!r}'.format(name, self.expression))
+            if name not in NUMEXPR_FUNCTIONS:
+                self._use_numexpr = False
+            return '{}({})'.format(name, ', '.join(self._translate(arg) for arg in node.args))
+        raise ValueError('Unsupported expression {!r} in query {!r}'.format(
+            type(node).__name__, self.expression))
+
+    def _translate_comparison(self, left, op, right):
+        if type(op) in _COMPARE_OPERATORS:
+            return '({} {} {})'.format(self._translate(left), _COMPARE_OPERATORS[type(op)], self._translate(right))
+        if isinstance(op, (ast.In, ast.NotIn)) and isinstance(right, (ast.List, ast.Tuple, ast.Set)):
+            self._use_numexpr = False
+            values = ', '.join(self._translate(element) for element in right.elts)
+            source = 'isin({}, [{}])'.format(self._translate(left), values)
+            return '(~{})'.format(source) if isinstance(op, ast.NotIn) else source
+        raise ValueError('Unsupported comparison {!r} in query {!r}'.format(type(op).__name__, self.expression))
+
+    def evaluate(self, columns):
+        """Evaluate the expression.
+
+        Parameters
+        ----------
+        columns: mapping or structured array
+            The values of all names used in the expression
+
+        Returns
+        -------
+            The result of the expression as an array
+        """
+        local_dict = dict((name, columns[name]) for name in self.names)
+        if self._use_numexpr:
+            try:
+                return numexpr.evaluate(self.source, local_dict=local_dict, global_dict={})
+            except (TypeError, ValueError, NotImplementedError):
+                # Unsupported types, such as unsigned integers or arrays of objects
+                pass
+        namespace = dict((name, getattr(np, name)) for name in NUMEXPR_FUNCTIONS | NUMPY_FUNCTIONS)
+        namespace['isin'] = np.isin
+        namespace['__builtins__'] = {}
+        namespace.update(local_dict)
+        return eval(self._code, namespace)
+
+    def mask(self, array):
+        """Return a boolean array selecting the rows of the structured array for which the expression is true."""
+        result = np.asarray(self.evaluate(array))
+        if result.dtype != np.bool_:
+            raise ValueError('query {!r} must evaluate to booleans, not {}'.format(self.expression, result.dtype))
+        return np.broadcast_to(result, (len(array),))
+
+    def __repr__(self):
+        return 'Query({!r})'.format(self.expression)
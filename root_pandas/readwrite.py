@@ -2,78 +2,130 @@
 """
 A module that extends pandas to support the ROOT data format.
 """
-from collections import Counter
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+import multiprocessing
+import os
 
 import numpy as np
-from numpy.lib.recfunctions import append_fields
 from pandas import DataFrame, RangeIndex
 import pandas as pd
-from root_numpy import root2array, list_trees
+from root_numpy import root2array, tree2array, list_trees
 import fnmatch
+import glob
+import hashlib
 from root_numpy import list_branches
-from root_numpy.extern.six import string_types
+from root_numpy.extern.six import string_types, reraise
+from root_numpy.extern.six.moves import queue
 import itertools
 from math import ceil
 import re
 import ROOT
+import sys
+import threading
 import warnings
 
+from .cache import DataCache, metadata_cache, parse_size
+from .instrumentation import IOStats, measure
+from .lazy import LazyFrame
+from .query import Query
 from .utils import stretch
+from .version import __version__
+
+try:
+    from .jagged import JaggedArray
+except ImportError:
+    # Extension arrays require pandas >= 0.24
+    JaggedArray = None
 
 
 __all__ = [
+    'RootWriter',
     'read_root',
     'to_root',
 ]
 
 NOEXPAND_PREFIX = 'noexpand:'
-
-
-def _getitem(string, depth=0):
+# The approximate memory taken by every numpy array in a column of arrays, on top of its values
+ARRAY_OBJECT_SIZE = 112
+# Prefix of the branches storing the lengths of variable-length arrays written by to_root
+JAGGED_LENGTH_PREFIX = '__rpLeN_'
+# ROOT compression algorithms and their default levels, see ROOT::RCompressionSetting
+COMPRESSION_ALGORITHMS = {
+    'zlib': (1, 1),
+    'lzma': (2, 7),
+    'lz4': (4, 4),
+    'zstd': (5, 5),
+}
+# ROOT leaf type codes of numpy dtypes
+ROOT_TYPE_CODES = {
+    'b1': 'O',
+    'i1': 'B', 'u1': 'b',
+    'i2': 'S', 'u2': 's',
+    'i4': 'I', 'u4': 'i',
+    'i8': 'L', 'u8': 'l',
+    'f4': 'F', 'f8': 'D',
+}
+
+
+# Characters which are special within brace patterns
+_BRACE_SPECIAL = re.compile(r'[{},\\]')
+# Patterns containing these are interpreted as shell patterns
+_GLOB_PATTERN = re.compile(r'[*?]|\[.*\]')
+
+
+def _getitem(string, pos=0, depth=0):
     """
-    Get an item from the string (where item is up to the next ',' or '}' or the
-    end of the string)
+    Get an item from the string starting at pos (where item is up to the next
+    ',' or '}' or the end of the string), returning the expansions of the item
+    and the position after it
     """
     out = [""]
-    while string:
-        char = string[0]
+    while pos < len(string):
+        char = string[pos]
         if depth and (char == ',' or char == '}'):
-            return out, string
+            return out, pos
         if char == '{':
-            groups_string = _getgroup(string[1:], depth+1)
-            if groups_string is not None:
-                groups, string = groups_string
+            group = _getgroup(string, pos + 1, depth + 1)
+            if group is not None:
+                groups, pos = group
                 out = [a + g for a in out for g in groups]
                 continue
-        if char == '\\' and len(string) > 1:
-            string, char = string[1:], char + string[1]
+            literal, pos = char, pos + 1
+        elif char == '\\' and pos + 1 < len(string):
+            literal, pos = string[pos:pos + 2], pos + 2
+        else:
+            # Consume everything up to the next special character at once
+            match = _BRACE_SPECIAL.search(string, pos + 1)
+            end = match.start() if match else len(string)
+            literal, pos = string[pos:end], end
 
-        out, string = [a + char for a in out], string[1:]
+        out = [a + literal for a in out]
 
-    return out, string
+    return out, pos
 
 
-def _getgroup(string, depth):
+def _getgroup(string, pos, depth):
     """
-    Get a group from the string, where group is a list of all the comma
-    separated substrings up to the next '}' char or the brace enclosed substring
-    if there is no comma
+    Get a group from the string starting at pos, where group is a list of all
+    the comma separated substrings up to the next '}' char or the brace
+    enclosed substring if there is no comma
     """
     out, comma = [], False
-    while string:
-        items, string = _getitem(string, depth)
+    while pos < len(string):
+        items, pos = _getitem(string, pos, depth)
 
-        if not string:
+        if pos >= len(string):
             break
         out += items
 
-        if string[0] == '}':
+        if string[pos] == '}':
             if comma:
-                return out, string[1:]
-            return ['{' + a + '}' for a in out], string[1:]
+                return out, pos + 1
+            return ['{' + a + '}' for a in out], pos + 1
 
-        if string[0] == ',':
-            comma, string = True, string[1:]
+        if string[pos] == ',':
+            comma, pos = True, pos + 1
 
     return None
 
@@ -93,26 +145,728 @@ def get_nonscalar_columns(array):
     return list(bad_names)
 
 
+def get_cluster_boundaries(path, key):
+    """Return the number of entries of a tree and the boundaries of its clusters.
+
+    Parameters
+    ----------
+    path: string
+        The path to the root file
+    key: string
+        The key of the tree
+
+    Returns
+    -------
+        A tuple of the number of entries and a list of the entry numbers at which
+        clusters start, followed by the number of entries. If the file doesn't
+        contain the tree, (0, [0]) is returned.
+    """
+    root_file = ROOT.TFile.Open(path)
+    if not root_file or root_file.IsZombie():
+        raise IOError("cannot open file {0}".format(path))
+    try:
+        tree = root_file.Get(key)
+        if not tree or not isinstance(tree, ROOT.TTree):
+            return 0, [0]
+        return _get_tree_clusters(tree)
+    finally:
+        root_file.Close()
+
+
+def _get_tree_clusters(tree):
+    """Return the number of entries of an open tree and the boundaries of its clusters, see get_cluster_boundaries"""
+    n_entries = tree.GetEntries()
+    boundaries = [0]
+    clusters = tree.GetClusterIterator(0)
+    start = clusters.Next()
+    while start < n_entries:
+        stop = min(clusters.GetNextEntry(), n_entries)
+        if stop <= start:
+            break
+        boundaries.append(stop)
+        start = clusters.Next()
+    if boundaries[-1] != n_entries:
+        boundaries.append(n_entries)
+    return n_entries, boundaries
+
+
+def _clip_boundaries(boundaries, start, stop):
+    """Return the cluster boundaries between start and stop, starting with start and ending with stop."""
+    return [start] + [edge for edge in boundaries if start < edge < stop] + [stop]
+
+
+def get_chunk_ranges(boundaries, chunksize, whole_clusters=True, file_entries=None):
+    """Split entries into chunks of at most `chunksize` entries.
+
+    Parameters
+    ----------
+    boundaries: sequence of int
+        Increasing entry numbers at which clusters start, followed by the total number of entries
+    chunksize: int
+        The maximum number of entries in a chunk
+    whole_clusters: bool (optional, default: True)
+        If True, clusters are only split if they contain more than `chunksize` entries.
+        Otherwise chunks contain exactly `chunksize` entries, except for the last one.
+    file_entries: sequence of (str, int) (optional, default: None)
+        The paths and numbers of entries of the files. If given with `whole_clusters`,
+        chunks never span several files.
+
+    Returns
+    -------
+        A list of (start, stop) tuples
+    """
+    if whole_clusters and file_entries is not None:
+        ranges = []
+        for start, stop in _get_file_ranges(boundaries, file_entries):
+            ranges.extend(get_chunk_ranges(_clip_boundaries(boundaries, start, stop), chunksize))
+        return ranges
+    if not whole_clusters:
+        boundaries = [boundaries[0], boundaries[-1]]
+    ranges = []
+    start = previous = boundaries[0]
+    for edge in boundaries[1:]:
+        if edge - start > chunksize and previous > start:
+            ranges.append((start, previous))
+            start = previous
+        while edge - start > chunksize:
+            ranges.append((start, start + chunksize))
+            start += chunksize
+        previous = edge
+    if previous > start:
+        ranges.append((start, previous))
+    return ranges
+
+
+def _get_file_ranges(boundaries, file_entries):
+    """Return the range of the entries between the first and last boundary within every file"""
+    ranges = []
+    offset = 0
+    for _, n_entries in file_entries:
+        ranges.append((max(offset, boundaries[0]), min(offset + n_entries, boundaries[-1])))
+        offset += n_entries
+    return ranges
+
+
+def get_branch_sizes(path, key):
+    """Return the average uncompressed size per entry of the branches of a tree, taken from the file's metadata.
+
+    Parameters
+    ----------
+    path: string
+        The path to the root file
+    key: string
+        The key of the tree
+
+    Returns
+    -------
+        A dict of the branch names to lists of the average number of bytes per entry, the average
+        number of elements per entry and whether the branch contains arrays. The dict is empty if
+        the file doesn't contain the tree.
+    """
+    root_file = ROOT.TFile.Open(path)
+    if not root_file or root_file.IsZombie():
+        raise IOError("cannot open file {0}".format(path))
+    try:
+        tree = root_file.Get(key)
+        if not tree or not isinstance(tree, ROOT.TTree):
+            return {}
+        n_entries = tree.GetEntries()
+        sizes = {}
+        for branch in tree.GetListOfBranches():
+            nbytes = float(branch.GetTotBytes('*')) / n_entries if n_entries else 0.
+            leaves = branch.GetListOfLeaves()
+            leaf = leaves.At(0) if leaves.GetEntries() else None
+            # Branches of classes such as std::vector are read as variable-length arrays
+            is_array = bool(branch.GetClassName()) or bool(leaf and (leaf.GetLeafCount() or leaf.GetLenStatic() > 1))
+            element_size = leaf.GetLenType() if leaf else 0
+            length = nbytes / element_size if is_array and element_size > 0 else 1.
+            sizes[branch.GetName()] = [nbytes, length, is_array]
+        return sizes
+    finally:
+        root_file.Close()
+
+
+def estimate_entry_size(branch_sizes, branches, flatten=None):
+    """Estimate the memory in bytes taken by one entry of the branches after reading and flattening them.
+
+    Parameters
+    ----------
+    branch_sizes: dict
+        The sizes of the branches as returned by get_branch_sizes
+    branches: sequence of str
+        The branches which are read. Unknown branches, such as formulas, are assumed to be doubles.
+    flatten: sequence of str or bool (optional, default: None)
+        The branches which are flattened, as passed to read_root
+
+    Returns
+    -------
+        The estimated number of bytes per entry
+    """
+    sizes = dict((name, branch_sizes.get(name, [8., 1., False])) for name in branches)
+    if not flatten:
+        return sum(nbytes + (ARRAY_OBJECT_SIZE if is_array else 0) for nbytes, _, is_array in sizes.values())
+    if flatten is True:
+        flattened = [name for name, (_, _, is_array) in sizes.items() if is_array]
+    else:
+        flattened = [name for name in flatten if name in sizes]
+    # Scalars are repeated for every element of the flattened arrays, which are
+    # numbered in __array_index. The other arrays are dropped.
+    scalar_size = sum(nbytes for nbytes, _, is_array in sizes.values() if not is_array) + 8
+    n_elements = max([sizes[name][1] for name in flattened] or [1.])
+    return n_elements * scalar_size + sum(sizes[name][0] for name in flattened)
+
+
+def get_memory_chunk_ranges(boundaries, file_entries, entry_sizes, max_bytes, chunksize=None, whole_clusters=True):
+    """Split the entries of every file into chunks whose estimated size is at most `max_bytes`.
+
+    Parameters
+    ----------
+    boundaries: sequence of int
+        Increasing entry numbers at which clusters start, followed by the total number of entries
+    file_entries: sequence of (str, int)
+        The paths and numbers of entries of the files
+    entry_sizes: sequence of float
+        The estimated number of bytes per entry of every file
+    max_bytes: int
+        The maximum size of a chunk
+    chunksize: int (optional, default: None)
+        The maximum number of entries in a chunk
+    whole_clusters: bool (optional, default: True)
+        See get_chunk_ranges
+
+    Returns
+    -------
+        A list of (start, stop) tuples, chunks never span several files
+    """
+    ranges = []
+    for (start, stop), entry_size in zip(_get_file_ranges(boundaries, file_entries), entry_sizes):
+        if start >= stop:
+            continue
+        file_chunksize = max(1, int(max_bytes // entry_size)) if entry_size > 0 else stop - start
+        if chunksize:
+            file_chunksize = min(file_chunksize, chunksize)
+        ranges.extend(get_chunk_ranges(_clip_boundaries(boundaries, start, stop), file_chunksize, whole_clusters))
+    return ranges
+
+
+def expand_paths(paths):
+    """Expand glob patterns and directories into the files they contain.
+
+    Directories are replaced by the .root files in them and glob patterns by the matching
+    files, both in sorted order. Remote paths (such as root://...) are kept as they are.
+
+    Parameters
+    ----------
+    paths: string or sequence of str
+        The paths, directories or glob patterns
+
+    Returns
+    -------
+        A list of paths
+    """
+    if isinstance(paths, string_types):
+        paths = [paths]
+    expanded = []
+    for path in paths:
+        if '://' in path or os.path.isfile(path):
+            expanded.append(path)
+        elif os.path.isdir(path):
+            names = sorted(name for name in os.listdir(path) if name.endswith('.root'))
+            expanded.extend(os.path.join(path, name) for name in names)
+        elif _GLOB_PATTERN.search(path):
+            matches = sorted(glob.glob(path))
+            if not matches:
+                raise IOError('No files match {}'.format(path))
+            expanded.extend(matches)
+        else:
+            expanded.append(path)
+    return expanded
+
+
+def _get_file_metadata(task):
+    """Return the entries and clusters of the tree `key` in a file, None if it isn't a tree, this is run by the workers."""
+    path, key = task
+    root_file = ROOT.TFile.Open(path)
+    if not root_file or root_file.IsZombie():
+        raise IOError("cannot open file {0}".format(path))
+    try:
+        # The key can be the path of a tree in a directory
+        tree = root_file.Get(key)
+        if not tree or not tree.InheritsFrom('TTree'):
+            return None
+        n_entries, clusters = _get_tree_clusters(tree)
+        return [n_entries, list(clusters)]
+    finally:
+        root_file.Close()
+
+
+def _scan_files(paths, key, executor=None):
+    """Get the number of entries in each file, the global cluster boundaries and the files without the tree.
+
+    The files which aren't in the metadata cache are scanned with the executor, if given.
+    Files without the tree have no entries.
+    """
+    results = {}
+    pending = []
+    for path in paths:
+        found, clusters = metadata_cache.lookup(path, 'clusters', [key])
+        if found:
+            results[path] = clusters
+        elif path not in pending:
+            pending.append(path)
+    if executor is None or len(pending) <= 1:
+        computed = [_get_file_metadata((path, key)) for path in pending]
+    else:
+        computed = executor.map(_get_file_metadata, [(path, key) for path in pending])
+    for path, clusters in zip(pending, computed):
+        results[path] = clusters
+        metadata_cache.store(path, 'clusters', [key], clusters)
+
+    file_entries = []
+    boundaries = [0]
+    missing = []
+    for path in paths:
+        if results[path] is None:
+            missing.append(path)
+            n_entries, clusters = 0, [0]
+        else:
+            n_entries, clusters = results[path]
+        file_entries.append((path, n_entries))
+        offset = boundaries[-1]
+        boundaries.extend(offset + edge for edge in clusters[1:])
+    return file_entries, boundaries, missing
+
+
+def _list_trees(path):
+    """list_trees using the metadata cache"""
+    return list(metadata_cache.get(path, 'trees', [], lambda: list(list_trees(path))))
+
+
+def _list_branches(path, key):
+    """list_branches using the metadata cache"""
+    return list(metadata_cache.get(path, 'branches', [key], lambda: list(list_branches(path, key))))
+
+
+def _get_branch_sizes(path, key):
+    """get_branch_sizes using the metadata cache"""
+    return metadata_cache.get(path, 'branch_sizes', [key], lambda: get_branch_sizes(path, key))
+
+
+def _get_segments(file_entries, start, stop):
+    """Convert a global entry range into a list of (path, start, stop) ranges within each file."""
+    segments = []
+    offset = 0
+    for path, n_entries in file_entries:
+        if start < offset + n_entries and stop > offset:
+            segments.append((path, max(start - offset, 0), min(stop - offset, n_entries)))
+        offset += n_entries
+    return segments
+
+
+def _locate_entry(file_entries, entry):
+    """Return the path of the file containing the entries just before `entry` (counted over all
+    files) and the number of entries before it within that file."""
+    offset = 0
+    for path, n_entries in file_entries:
+        if offset < entry <= offset + n_entries:
+            return path, entry - offset
+        offset += n_entries
+    return file_entries[0][0], 0
+
+
+def _read_segments(task):
+    """Read the entry ranges of a task into a single array, this is run by the workers.
+
+    Ranges can contain the positions of the rows to keep, which are taken from every
+    range before the next one is read.
+    """
+    key, branches, selection, segments, kwargs = task
+    arrays = []
+    for segment in segments:
+        path, start, stop = segment[:3]
+        arr = root2array(path, key, branches, selection=selection, start=start, stop=stop, **kwargs)
+        arrays.append(arr[segment[3]] if len(segment) > 3 else arr)
+    return arrays[0] if len(arrays) == 1 else np.concatenate(arrays)
+
+
+def _find_selected_entries(task):
+    """Return the entries of a file passing the selection, this is run by the workers."""
+    path, key, selection, start, stop = task
+    # Only the branches used in the selection are read
+    entries = root2array(path, key, ['Entry$'], selection=selection, start=start, stop=stop)['Entry$']
+    return entries.astype(np.int64)
+
+
+def find_selected_entries(file_entries, key, selection, executor=None, candidates=None):
+    """Return the sorted global entry numbers passing the selection.
+
+    Parameters
+    ----------
+    file_entries: list of (str, int)
+        The path and number of entries of each file
+    key: string
+        The key of the tree
+    selection: string
+        The selection expression
+    executor: object (optional, default: None)
+        An executor to scan the files in parallel with
+    candidates: array (optional, default: None)
+        If given, only these sorted entries are considered and only the part of
+        each file between the first and last of them is read
+
+    Returns
+    -------
+        An array of int64 entry numbers within the chain of all files
+    """
+    tasks = []
+    offsets = []
+    offset = 0
+    for path, n_entries in file_entries:
+        start, stop = 0, n_entries
+        if candidates is not None:
+            first, last = np.searchsorted(candidates, [offset, offset + n_entries])
+            if first < last:
+                start, stop = candidates[first] - offset, candidates[last - 1] - offset + 1
+            else:
+                start = stop
+        if stop > start:
+            tasks.append((path, key, selection, int(start), int(stop)))
+            offsets.append(offset)
+        offset += n_entries
+    if executor is None or len(tasks) <= 1:
+        results = map(_find_selected_entries, tasks)
+    else:
+        results = executor.map(_find_selected_entries, tasks)
+    entries = [local + offset for offset, local in zip(offsets, results)]
+    if not entries:
+        return np.zeros(0, dtype=np.int64)
+    entries = np.concatenate(entries)
+    if candidates is not None:
+        entries = np.intersect1d(entries, candidates, assume_unique=True)
+    return entries
+
+
+def _sample_entries(n_entries, fraction, random_state):
+    """Select each of n_entries entries with probability `fraction`, from the gaps between selected entries."""
+    if fraction >= 1:
+        return np.arange(n_entries, dtype=np.int64)
+    samples = []
+    position = -1
+    batch_size = int(n_entries * fraction * 1.1) + 100
+    while fraction > 0:
+        positions = position + np.cumsum(random_state.geometric(fraction, batch_size))
+        samples.append(positions[positions < n_entries])
+        if positions[-1] >= n_entries:
+            break
+        position = positions[-1]
+    if not samples:
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate(samples).astype(np.int64)
+
+
+def get_entry_list(n_entries, entries=None, entry_list=None, sample=None, seed=None):
+    """Return the sorted global entry numbers requested by one of entries, entry_list or sample.
+
+    Parameters
+    ----------
+    n_entries: int
+        The total number of entries
+    entries: slice
+        A range of entries
+    entry_list: array of int
+        Entry numbers, negative numbers count from the end
+    sample: float
+        The fraction of randomly selected entries
+    seed: int or numpy.random.RandomState
+        The seed of the random selection
+
+    Returns
+    -------
+        An int64 array, or None if none of the options is given
+    """
+    if sum(option is not None for option in (entries, entry_list, sample)) > 1:
+        raise ValueError('Only one of entries, entry_list and sample can be given')
+    if entries is not None:
+        if not isinstance(entries, slice):
+            raise TypeError('entries must be a slice, not {}'.format(type(entries).__name__))
+        return np.sort(np.arange(*entries.indices(n_entries), dtype=np.int64))
+    if entry_list is not None:
+        entry_list = np.asarray(entry_list, dtype=np.int64).ravel()
+        entry_list = np.where(entry_list < 0, entry_list + n_entries, entry_list)
+        if len(entry_list) and (entry_list.min() < 0 or entry_list.max() >= n_entries):
+            raise IndexError('entry_list contains entries outside of the {} entries'.format(n_entries))
+        return np.unique(entry_list)
+    if sample is not None:
+        if not 0 <= sample <= 1:
+            raise ValueError('sample must be a fraction between 0 and 1')
+        random_state = seed if isinstance(seed, np.random.RandomState) else np.random.RandomState(seed)
+        return _sample_entries(n_entries, sample, random_state)
+    return None
+
+
+def get_selected_ranges(boundaries, entries, start, stop, max_entries=100000):
+    """Group the selected entries between start and stop by the clusters containing them.
+
+    Consecutive clusters containing selected entries are merged into ranges of up to
+    `max_entries` entries, clusters without selected entries are skipped.
+
+    Returns
+    -------
+        A list of (start, stop, entries) tuples, and the number of clusters read and skipped
+    """
+    boundaries = np.asarray(boundaries, dtype=np.int64)
+    inner = boundaries[(boundaries > start) & (boundaries < stop)]
+    boundaries = np.concatenate([[start], inner, [stop]])
+    entries = entries[(entries >= start) & (entries < stop)]
+    clusters = np.unique(np.searchsorted(boundaries, entries, side='right') - 1)
+    ranges = []
+    for cluster in clusters:
+        low, high = boundaries[cluster], boundaries[cluster + 1]
+        if ranges and ranges[-1][1] == low and high - ranges[-1][0] <= max_entries:
+            ranges[-1][1] = high
+        else:
+            ranges.append([low, high])
+    result = []
+    for low, high in ranges:
+        first, last = np.searchsorted(entries, [low, high])
+        result.append((int(low), int(high), entries[first:last]))
+    return result, len(clusters), len(boundaries) - 1 - len(clusters)
+
+
+def _get_selected_segments(file_entries, ranges):
+    """Convert the ranges of `get_selected_ranges` into (path, start, stop, take) ranges within each file.
+
+    `take` are the positions of the selected entries within the range, ranges of files without
+    selected entries are left out.
+    """
+    segments = []
+    for low, high, entries in ranges:
+        offset = 0
+        for path, n_entries in file_entries:
+            start, stop = max(low, offset), min(high, offset + n_entries)
+            if start < stop:
+                first, last = np.searchsorted(entries, [start, stop])
+                if last > first:
+                    segments.append((path, start - offset, stop - offset, entries[first:last] - start))
+            offset += n_entries
+    return segments
+
+
+class _LazyPool(object):
+    """A process pool with `n_workers` processes which is only started when it is first used.
+
+    Closing it stops the processes, and using it again starts a new pool.
+    """
+
+    def __init__(self, n_workers):
+        self.n_workers = n_workers
+        self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(self.n_workers)
+        return self._pool
+
+    def map(self, function, iterable):
+        return self._get_pool().map(function, iterable)
+
+    def apply_async(self, function, args=()):
+        return self._get_pool().apply_async(function, args)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def __del__(self):
+        self.close()
+
+
+def _make_executor(n_workers=None, executor=None):
+    """Return the given executor, or a lazily started process pool with `n_workers` processes if needed."""
+    if executor is not None or n_workers is None or n_workers <= 1:
+        return executor
+    return _LazyPool(n_workers)
+
+
+@contextmanager
+def _get_executor(n_workers=None, executor=None):
+    """Use the given executor or a process pool with `n_workers` processes, started only if it is used."""
+    executor_ = _make_executor(n_workers, executor)
+    try:
+        yield executor_
+    finally:
+        if executor_ is not executor:
+            executor_.close()
+
+
+@contextmanager
+def _open_chain(key, file_entries):
+    """Open a TChain of the files without reading their number of entries again."""
+    tchain = ROOT.TChain(key)
+    for path, n_entries in file_entries:
+        if n_entries:
+            tchain.Add(path, n_entries)
+    try:
+        yield tchain
+    finally:
+        tchain.Reset()
+
+
+def _ordered_map(executor, function, iterable, window):
+    """Map `function` using `executor` with at most `window` pending tasks, yielding results in order."""
+    if not hasattr(executor, 'submit') and not hasattr(executor, 'apply_async'):
+        for result in executor.map(function, iterable):
+            yield result
+        return
+    pending = deque()
+    for item in iterable:
+        if hasattr(executor, 'submit'):
+            pending.append(executor.submit(function, item).result)
+        else:
+            pending.append(executor.apply_async(function, (item,)).get)
+        if len(pending) >= window:
+            yield pending.popleft()()
+    while pending:
+        yield pending.popleft()()
+
+
+def _prefetch(iterable, size):
+    """Consume `iterable` in a background thread, keeping up to `size` items ready."""
+    ROOT.ROOT.EnableThreadSafety()
+    items = queue.Queue(maxsize=size)
+    stopped = threading.Event()
+    done = object()
+
+    def put(item):
+        # Don't block forever if the consumer went away
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except Exception:
+            put((done, sys.exc_info()))
+
+    thread = threading.Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            item, exc_info = items.get()
+            if item is done:
+                if exc_info is not None:
+                    reraise(*exc_info)
+                return
+            yield item
+    finally:
+        stopped.set()
+        thread.join()
+
+
+class PatternMatcher(object):
+    """Match branch names against a sequence of shell patterns in a single pass.
+
+    Patterns without any of *, ? or [] are looked up directly, all other patterns
+    are combined into a single regular expression.
+
+    Parameters
+    ----------
+    patterns: sequence of str
+        The patterns to match
+    """
+    # Python 2 limits the number of groups in a regular expression to 100
+    max_group_size = 90 if sys.version_info < (3, 5) else 10000
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self._globs = [i for i, pattern in enumerate(self.patterns) if _GLOB_PATTERN.search(pattern)]
+        self._regexes = []
+        for i in range(0, len(self._globs), self.max_group_size):
+            indices = self._globs[i:i + self.max_group_size]
+            regex = '|'.join('(?P<p{}>{})'.format(j, fnmatch.translate(self.patterns[j])) for j in indices)
+            self._regexes.append(re.compile(regex))
+
+    def _match_glob(self, branch):
+        """Return the index of the first glob pattern matching branch, or None"""
+        for regex in self._regexes:
+            match = regex.match(branch)
+            if match:
+                return int(match.lastgroup[1:])
+        return None
+
+    def match(self, branches, fail=True):
+        """Return the branches matching any of the patterns.
+
+        Exact matches come first in the order of the patterns, followed by the
+        matches of shell patterns in the order of the patterns and of branches.
+        If `fail` is True, a ValueError is raised if a pattern doesn't match any branch.
+        """
+        branch_set = set(branches)
+        selected, selected_set = [], set()
+        for pattern in self.patterns:
+            if pattern in branch_set and pattern not in selected_set:
+                selected_set.add(pattern)
+                selected.append(pattern)
+        if any(self.patterns[i] in branch_set for i in self._globs):
+            # Patterns which match a branch exactly aren't expanded
+            others = [p for p in self.patterns if p not in branch_set]
+            return selected + compile_patterns(others, expand=False).match(branches, fail=fail)
+
+        matched = set()
+        glob_matches = []
+        if self._regexes:
+            for position, branch in enumerate(branches):
+                index = self._match_glob(branch)
+                if index is not None:
+                    matched.add(index)
+                    glob_matches.append((index, position, branch))
+        glob_matches.sort()
+        for _, _, branch in glob_matches:
+            if branch not in selected_set:
+                selected_set.add(branch)
+                selected.append(branch)
+
+        if fail:
+            for i, pattern in enumerate(self.patterns):
+                if pattern in branch_set or i in matched:
+                    continue
+                # The pattern might only match branches which matched a previous pattern
+                if i in self._globs and fnmatch.filter(branch_set, pattern):
+                    continue
+                raise ValueError("Pattern '{}' didn't match any branch".format(pattern))
+        return selected
+
+
+_compiled_patterns = OrderedDict()
+
+
+def compile_patterns(patterns, expand=True):
+    """Return a (cached) PatternMatcher for the patterns, expanding braces in them if `expand` is True"""
+    key = (tuple(patterns), expand)
+    matcher = _compiled_patterns.pop(key, None)
+    if matcher is None:
+        if expand:
+            patterns = list(itertools.chain.from_iterable(map(expand_braces, patterns)))
+        matcher = PatternMatcher(patterns)
+    _compiled_patterns[key] = matcher
+    while len(_compiled_patterns) > 256:
+        _compiled_patterns.popitem(last=False)
+    return matcher
+
+
 def get_matching_variables(branches, patterns, fail=True):
-    # Convert branches to a set to make x "in branches" O(1) on average
-    branches = set(branches)
-    # Find any trivial matches
-    selected = sorted(branches.intersection(patterns),
-                      key=lambda s: patterns.index(s))
-    # Any matches that weren't trivial need to be looped over...
-    for pattern in set(patterns).difference(selected):
-        found = False
-        # Avoid using fnmatch if the pattern if possible
-        if re.findall(r'(\*)|(\?)|(\[.*\])|(\[\!.*\])', pattern):
-            for match in fnmatch.filter(branches, pattern):
-                found = True
-                if match not in selected:
-                    selected.append(match)
-        elif pattern in branches:
-            raise NotImplementedError('I think this is impossible?')
-        if not found and fail:
-            raise ValueError("Pattern '{}' didn't match any branch".format(pattern))
-    return selected
+    return compile_patterns(patterns, expand=False).match(branches, fail=fail)
 
 
 def filter_noexpand_columns(columns):
@@ -138,7 +892,7 @@ def do_flatten(arr, flatten):
     if flatten is True:
         warnings.warn(" The option flatten=True is deprecated. Please specify the branches you would like "
                       "to flatten in a list: flatten=['foo', 'bar']", FutureWarning)
-        arr_, idx = stretch(arr, return_indices=True)
+        arr = stretch(arr, index_field='__array_index')
     else:
         nonscalar = get_nonscalar_columns(arr)
         fields = [x for x in arr.dtype.names if (x not in nonscalar or x in flatten)]
@@ -153,12 +907,64 @@ def do_flatten(arr, flatten):
                 raise ValueError("Requested to flatten {col} but it wasn't loaded from the input file"
                                  .format(col=col))
 
-        arr_, idx = stretch(arr, fields=fields, return_indices=True)
-    arr = append_fields(arr_, '__array_index', idx, usemask=False, asrecarray=True)
+        arr = stretch(arr, fields=fields, index_field='__array_index')
     return arr
 
 
-def read_root(paths, key=None, columns=None, ignore=None, chunksize=None, where=None, flatten=False, *args, **kwargs):
+def _find_tree(path):
+    """Return the name of the only tree in the file"""
+    trees = _list_trees(path)
+    if len(trees) == 1:
+        return trees[0]
+    elif len(trees) == 0:
+        raise ValueError('No trees found in {}'.format(path))
+    else:
+        raise ValueError('More than one tree found in {}'.format(path))
+
+
+def _resolve_branches(branches, columns=None, ignore=None, query=None):
+    """Return the branches to read, the formulas among them, the Query and the branches only read for it"""
+    noexpand = []
+    if not columns:
+        all_vars = branches
+    else:
+        if isinstance(columns, string_types):
+            columns = [columns]
+        # __index__* is always loaded if it exists
+        # XXX Figure out what should happen with multi-dimensional indices
+        index_branches = list(filter(lambda x: x.startswith('__index__'), branches))
+        if index_branches:
+            columns = columns[:]
+            columns.append(index_branches[0])
+        columns, noexpand = filter_noexpand_columns(columns)
+        all_vars = compile_patterns(columns).match(branches) + noexpand
+
+    if ignore:
+        if isinstance(ignore, string_types):
+            ignore = [ignore]
+        ignored = set(compile_patterns(ignore).match(branches, fail=False))
+        if any(map(lambda x: x.startswith('__index__'), ignored)):
+            raise ValueError('__index__* branch is being ignored!')
+        all_vars = [var for var in all_vars if var not in ignored]
+
+    query_vars = []
+    if query is not None:
+        if not isinstance(query, Query):
+            query = Query(query)
+        missing = [name for name in query.names if name not in branches]
+        if missing:
+            raise ValueError('Unknown branches in query: {}'.format(', '.join(missing)))
+        # Branches only needed for the query are removed again after evaluating it
+        query_vars = [name for name in query.names if name not in all_vars]
+        all_vars = all_vars + query_vars
+    return all_vars, noexpand, query, query_vars
+
+
+def read_root(paths, key=None, columns=None, ignore=None, chunksize=None, where=None, flatten=False,
+              chunk_align='cluster', n_workers=None, executor=None, prefetch=None, jagged=None,
+              pushdown=False, stats=None, query=None, entries=None, entry_list=None, sample=None, seed=None,
+              cache_dir=None, cache_size='10GB', output='dataframe', chunk_memory=None, lazy=False,
+              resume_from=None, warn_missing_tree=False, *args, **kwargs):
     """
     Read a ROOT file, or list of ROOT files, into a pandas DataFrame.
     Further *args and *kwargs are passed to root_numpy's root2array.
@@ -187,10 +993,87 @@ def read_root(paths, key=None, columns=None, ignore=None, chunksize=None, where=
         Be careful if you combine this with chunksize, as chunksize will refer to the number of unflattened entries,
         so you will be iterating over a number of entries that is potentially larger than chunksize.
         The index of each element within its former array will be saved in the __array_index column.
+    chunk_align: {'cluster', 'entries'}
+        How chunk boundaries are chosen when chunksize is given (default: 'cluster'). With 'cluster',
+        chunks are made of whole clusters of the tree (and never span two files) unless a single cluster
+        is larger than chunksize, in which case it is split. Chunks then contain up to `chunksize` rows.
+        With 'entries', every chunk except the last one contains exactly `chunksize` entries.
+    n_workers: int
+        If larger than 1, the files (or cluster aligned entry ranges within them) are read in a pool
+        of `n_workers` processes. The result is assembled in the original order. When iterating over
+        chunks, the following chunks are read in parallel while the current one is processed.
+    executor: object
+        An existing executor to read with instead of creating a process pool, such as a
+        `concurrent.futures.ProcessPoolExecutor` or a `multiprocessing.Pool`.
+    prefetch: int
+        When iterating over chunks, read and convert up to `prefetch` chunks ahead in a background
+        thread while the current chunk is being processed.
+    jagged: {None, 'offsets'}
+        How columns of arrays are returned. By default every row contains a numpy array. With 'offsets',
+        such columns are returned as a `root_pandas.jagged.JaggedArray`, which stores all values in a
+        single contiguous array and supports vectorised operations through the `Series.jagged` accessor.
+    pushdown: bool (optional, default: False)
+        If True and `where` is given, the entries passing the selection are found first by reading only
+        the branches used in `where`. The other columns are then only read for the clusters containing
+        selected entries, which saves I/O for selections that discard most entries.
+    stats: root_pandas.instrumentation.IOStats (optional, default: None)
+        If given, the bytes read, the numbers of entries and clusters read and skipped and the time
+        spent in each stage are added to this object.
+    query: str (optional, default: None)
+        Only rows for which this pandas-style expression is true are returned, such as
+        `'(pt > 20) & (abs(eta) < 2.5)'`. Unlike `where`, it is evaluated on whole arrays with
+        numexpr (if installed) or numpy after reading (and flattening) each chunk, and the
+        branches it uses don't need to be in `columns`. See `root_pandas.query.Query`.
+    entries: slice (optional, default: None)
+        Only read this range of entries, counted over all files. Only the clusters containing
+        these entries are read.
+    entry_list: array of int (optional, default: None)
+        Only read these entries, counted over all files (negative numbers count from the end).
+        The rows are returned in increasing order of entries, and only the clusters containing
+        them are read.
+    sample: float (optional, default: None)
+        Only read a random sample of this fraction of the entries. Every entry is
+        selected independently, so the size of the sample varies.
+    seed: int or numpy.random.RandomState (optional, default: None)
+        The seed used to draw the sample
+    cache_dir: string (optional, default: None)
+        If given, the columns read are stored in this directory, and reading the same columns from
+        the same (unmodified, local) files with the same options again only maps the stored columns
+        into memory. Can't be combined with chunksize or chunk_memory. See `root_pandas.cache.DataCache`.
+    cache_size: int or string (optional, default: '10GB')
+        The maximum size of `cache_dir`, such as '500MB'. The least recently used entries are removed
+        when it is exceeded.
+    output: {'dataframe', 'arrow'}
+        The type of the result (default: 'dataframe'). With 'arrow', a `pyarrow.Table` is returned
+        instead of a DataFrame, or an iterator of `pyarrow.RecordBatch` if chunksize is given. Columns
+        of variable-length arrays become list arrays and the index becomes a normal column.
+        See `root_pandas.arrow.convert_to_arrow`.
+    chunk_memory: int or str (optional, default: None)
+        If given, an iterator is returned that yields DataFrames whose estimated size after flattening
+        is at most this number of bytes, such as '512MB'. The size of an entry is estimated for every
+        file from the uncompressed sizes of the branches, including the average length of arrays.
+        Chunks never span several files and contain at least one entry. If chunksize is also given,
+        chunks contain at most `chunksize` entries.
+    lazy: bool (optional, default: False)
+        If True, a `root_pandas.lazy.LazyFrame` is returned instead of a DataFrame. Its columns
+        are only read when they are first accessed, and then kept in memory. All other options
+        apply to every read. Can't be combined with chunksize, chunk_memory or flatten.
+    resume_from: dict (optional, default: None)
+        When iterating over chunks, start after the position of a chunk from a previous iteration
+        over the same files, as stored in the `position` attribute of the iterator. Earlier entries
+        are not read, and the index continues from where it stopped. A ValueError is raised if the
+        position doesn't match the files.
+    warn_missing_tree: bool (optional, default: False)
+        Files which don't contain the tree are skipped. If True, a RuntimeWarning is issued for each of them.
 
     Returns
     -------
-        DataFrame created from matching data in the specified TTree
+        DataFrame (or Arrow table) created from matching data in the specified TTree.
+        With chunksize or chunk_memory, an iterator over chunks whose `len` is the number of chunks.
+        After every chunk, its `position` attribute is a JSON-serializable dict of the `file` and the
+        `entry` within it where the chunk ended, the same `global_entry` counted over all files and the
+        `index` of the next row, which can be passed as `resume_from`. `with_positions()` iterates
+        over (chunk, position) pairs.
 
     Notes
     -----
@@ -199,167 +1082,535 @@ def read_root(paths, key=None, columns=None, ignore=None, chunksize=None, where=
 
     """
 
-    if not isinstance(paths, list):
-        paths = [paths]
-    # Use a single file to search for trees and branches, ensuring the key exists
-    for seed_path in paths:
-        trees = list_trees(seed_path)
-        if key and key not in trees:
-            continue
-        break
-    else:
-        if key:
-            raise OSError('{} not found in any of the given paths'.format(key))
-        else:
-            raise OSError('No trees found in any of the given paths')
+    # The options of the reads of the columns of a LazyFrame
+    lazy_options = dict(kwargs, where=where, n_workers=n_workers, executor=executor, jagged=jagged,
+                        pushdown=pushdown, stats=stats, query=query, entries=entries, entry_list=entry_list,
+                        sample=sample, seed=seed, cache_dir=cache_dir, cache_size=cache_size)
+
+    with measure(stats, 'metadata'):
+        paths = expand_paths(paths)
+    if not paths:
+        raise OSError('No trees found in any of the given paths')
 
     if not key:
-        if len(trees) == 1:
-            key = trees[0]
-        elif len(trees) == 0:
-            raise ValueError('No trees found in {}'.format(seed_path))
+        with measure(stats, 'metadata'):
+            key = _find_tree(paths[0])
+
+    # A single pool is used for scanning the files, selecting and reading the entries, and is
+    # only started if any of them is done in parallel. It is closed once all entries are read,
+    # or when it is garbage collected if reading fails.
+    executor_ = _make_executor(n_workers, executor)
+
+    def close_executor():
+        if executor_ is not executor:
+            executor_.close()
+
+    # Get the entries of all files in one pass, which is reused for planning the reads
+    with measure(stats, 'metadata'):
+        file_entries, boundaries, missing = _scan_files(paths, key, executor_)
+    # Files without the tree are skipped
+    if warn_missing_tree:
+        for path in missing:
+            warnings.warn('Tree {} not found in {}'.format(key, path), RuntimeWarning)
+    missing = set(missing)
+    paths = [path for path in paths if path not in missing]
+    if not paths:
+        raise OSError('{} not found in any of the given paths'.format(key))
+
+    # Use a single file to search for branches
+    seed_path = paths[0]
+    with measure(stats, 'metadata'):
+        branches = _list_branches(seed_path, key)
+
+    with measure(stats, 'resolve'):
+        all_vars, noexpand, query, query_vars = _resolve_branches(branches, columns, ignore, query)
+
+    if jagged not in (None, 'offsets'):
+        raise ValueError('Unknown jagged: {}. Must be None or "offsets".'.format(jagged))
+    if jagged and JaggedArray is None:
+        raise ImportError('jagged="offsets" requires pandas >= 0.24')
+    if chunk_align not in ('cluster', 'entries'):
+        raise ValueError('Unknown chunk_align: {}. Must be "cluster" or "entries".'.format(chunk_align))
+    chunked = bool(chunksize or chunk_memory is not None)
+    if cache_dir is not None and chunked:
+        raise ValueError('cache_dir can not be combined with chunksize or chunk_memory')
+    if lazy and (chunked or flatten or output != 'dataframe'):
+        raise ValueError('lazy can not be combined with chunksize, chunk_memory, flatten or output')
+    if lazy and args:
+        # The reads of the columns only pass on keyword arguments
+        raise ValueError('lazy can not be combined with positional arguments of root2array, pass them by keyword')
+    if output not in ('dataframe', 'arrow'):
+        raise ValueError('Unknown output: {}. Must be "dataframe" or "arrow".'.format(output))
+    if output == 'arrow':
+        from .arrow import convert_to_arrow
+    parallel = executor is not None or (n_workers is not None and n_workers > 1)
+    n_total = boundaries[-1]
+    has_range = any(name in kwargs for name in ('start', 'stop', 'step'))
+    if has_range and (chunked or parallel) and not (pushdown and where):
+        # Chunks and workers pass their own ranges of entries to root_numpy, so the range is read like entries
+        if entries is not None or entry_list is not None or sample is not None:
+            raise ValueError('start, stop and step can not be combined with entries, entry_list or sample')
+        entries = slice(*[kwargs.pop(name, None) for name in ('start', 'stop', 'step')])
+    restricted = isinstance(entries, slice) and entries.step in (None, 1)
+    if restricted:
+        # A contiguous range of entries only limits the clusters which are read
+        start, stop, _ = entries.indices(n_total)
+        boundaries = _clip_boundaries(boundaries, start, max(start, stop))
+        entries = None
+    entry_list = get_entry_list(n_total, entries, entry_list, sample, seed)
+    if (restricted or entry_list is not None) and any(name in kwargs for name in ('start', 'stop', 'step')):
+        raise ValueError('start, stop and step can not be combined with entries, entry_list or sample')
+    # Pushing down the selection only makes sense if there is one
+    pushdown = bool(pushdown and where) or entry_list is not None
+    entry_range = [None, None, None]
+    if pushdown:
+        # The entry range is applied to the selected entries instead of passing it to root_numpy
+        entry_range = [kwargs.pop(name, None) for name in ('start', 'stop', 'step')]
+
+    def select_entries():
+        """Find the requested entries passing the selection by only reading the branches it uses"""
+        if where:
+            with measure(stats, 'select'):
+                selected = find_selected_entries(file_entries, key, where, executor_, candidates=entry_list)
         else:
-            raise ValueError('More than one tree found in {}'.format(seed_path))
-
-    branches = list_branches(seed_path, key)
-
-    if not columns:
-        all_vars = branches
-    else:
-        if isinstance(columns, string_types):
-            columns = [columns]
-        # __index__* is always loaded if it exists
-        # XXX Figure out what should happen with multi-dimensional indices
-        index_branches = list(filter(lambda x: x.startswith('__index__'), branches))
-        if index_branches:
-            columns = columns[:]
-            columns.append(index_branches[0])
-        columns, noexpand = filter_noexpand_columns(columns)
-        columns = list(itertools.chain.from_iterable(list(map(expand_braces, columns))))
-        all_vars = get_matching_variables(branches, columns) + noexpand
+            selected = entry_list
+        start, stop, step = entry_range
+        start = start or 0
+        mask = selected >= start
+        if stop is not None:
+            mask &= selected < stop
+        if step is not None and step != 1:
+            mask &= (selected - start) % step == 0
+        selected = selected[mask]
+        if stats is not None:
+            stats.entries_selected += len(selected)
+        return selected
+
+    def get_ranges(selected, start, stop):
+        """Return the ranges of clusters containing selected entries between start and stop"""
+        selected_ranges, n_read, n_skipped = get_selected_ranges(boundaries, selected, start, stop)
+        if stats is not None:
+            n_entries = sum(high - low for low, high, _ in selected_ranges)
+            stats.entries_read += n_entries
+            stats.entries_skipped += stop - start - n_entries
+            stats.clusters_read += n_read
+            stats.clusters_skipped += n_skipped
+        return selected_ranges
+
+    def read_range(tchain, start, stop, selected=None):
+        """Read the entries between start and stop from the chain, None if no entry is selected"""
+        if selected is None:
+            with measure(stats, 'read'):
+                arr = tree2array(tchain, all_vars, start=start, stop=stop, selection=where, *args, **kwargs)
+            if stats is not None:
+                stats.entries_read += stop - start
+                stats.bytes_decompressed += arr.nbytes
+            return arr
+        selected_ranges = get_ranges(selected, start, stop)
+        if not selected_ranges:
+            return None
+        arrays = []
+        for low, high, entries in selected_ranges:
+            with measure(stats, 'read'):
+                arr = tree2array(tchain, all_vars, start=low, stop=high, *args, **kwargs)
+            if stats is not None:
+                stats.bytes_decompressed += arr.nbytes
+            # Only the selected rows are kept while the next range is read
+            arrays.append(arr[entries - low])
+        return np.concatenate(arrays)
+
+    def get_task(start, stop, selected=None):
+        """Return the task for reading the entries between start and stop in a worker, None if no entry is selected"""
+        if selected is None:
+            if stats is not None:
+                stats.entries_read += stop - start
+            return (key, all_vars, where, _get_segments(file_entries, start, stop), kwargs)
+        selected_ranges = get_ranges(selected, start, stop)
+        if not selected_ranges:
+            return None
+        return (key, all_vars, None, _get_selected_segments(file_entries, selected_ranges), kwargs)
+
+    def read_parallel(tasks, window):
+        """Read the tasks in parallel, yielding the arrays in order"""
+        arrays = _ordered_map(executor_, _read_segments, (task for task in tasks if task is not None), window)
+        while True:
+            with measure(stats, 'read'):
+                arr = next(arrays, None)
+            if arr is None:
+                return
+            if stats is not None:
+                stats.bytes_decompressed += arr.nbytes
+            yield arr
+
+    def prepare(arr):
+        """Flatten the array and keep the rows passing the query"""
+        if flatten:
+            with measure(stats, 'flatten'):
+                arr = do_flatten(arr, flatten)
+        if query is not None:
+            with measure(stats, 'query'):
+                arr = arr[query.mask(arr)]
+                if query_vars:
+                    arr = arr[[name for name in arr.dtype.names if name not in query_vars]]
+        return arr
+
+    def convert(arr, start_index=None):
+        with measure(stats, 'convert'):
+            if output == 'arrow':
+                # Chunks are returned as a stream of record batches
+                result = convert_to_arrow(arr, batch=chunked)
+            else:
+                result = convert_to_dataframe(arr, start_index=start_index, jagged=jagged, stats=stats)
+        if stats is not None:
+            nbytes = result.nbytes if output == 'arrow' else int(result.memory_usage().sum())
+            if isinstance(arr, np.ndarray):
+                nbytes += arr.nbytes
+            stats.record_chunk(len(result), nbytes)
+        return result
+
+    if chunk_memory is not None:
+        max_bytes = parse_size(chunk_memory)
+        with measure(stats, 'metadata'):
+            entry_sizes = [estimate_entry_size(_get_branch_sizes(path, key), all_vars, flatten) if n_entries else 0
+                           for path, n_entries in file_entries]
+        ranges = get_memory_chunk_ranges(boundaries, file_entries, entry_sizes, max_bytes, chunksize,
+                                         whole_clusters=(chunk_align == 'cluster'))
+    elif chunksize:
+        ranges = get_chunk_ranges(boundaries, chunksize, whole_clusters=(chunk_align == 'cluster'),
+                                  file_entries=file_entries)
+
+    if resume_from is not None:
+        if not chunked:
+            raise ValueError('resume_from requires chunksize or chunk_memory')
+        resume_entry = resume_from['global_entry']
+        if not 0 <= resume_entry <= n_total or \
+                _locate_entry(file_entries, resume_entry) != (resume_from['file'], resume_from['entry']):
+            raise ValueError('resume_from does not match the files being read: {}'.format(resume_from))
+        ranges = [(max(start, resume_entry), stop) for start, stop in ranges if stop > resume_entry]
+
+    def get_position(stop, index):
+        path, entry = _locate_entry(file_entries, stop)
+        return {'file': path, 'entry': int(entry), 'global_entry': int(stop), 'index': int(index)}
+
+    if chunked:
 
-    if ignore:
-        if isinstance(ignore, string_types):
-            ignore = [ignore]
-        ignored = get_matching_variables(branches, ignore, fail=False)
-        ignored = list(itertools.chain.from_iterable(list(map(expand_braces, ignored))))
-        if any(map(lambda x: x.startswith('__index__'), ignored)):
-            raise ValueError('__index__* branch is being ignored!')
-        for var in ignored:
-            all_vars.remove(var)
+        class genchunk(object):
+            def __init__(self):
+                # The position after the last chunk which was yielded
+                self.position = resume_from
+                self._selected = None
 
-    if chunksize:
-        tchain = ROOT.TChain(key)
-        for path in paths:
-            tchain.Add(path)
-        n_entries = tchain.GetEntries()
-        n_chunks = int(ceil(float(n_entries) / chunksize))
-        # XXX could explicitly clean up the opened TFiles with TChain::Reset
+            def _select(self, where_only=False):
+                """Find the selected entries once, also without pushdown if `where_only`"""
+                if self._selected is None and (pushdown or (where_only and where)):
+                    self._selected = select_entries()
+                return self._selected
 
-        class genchunk(object):
             def __len__(self):
-                return n_chunks
-
-            def __iter__(self):
-                current_index = 0
-                for chunk in range(n_chunks):
-                    arr = root2array(paths, key, all_vars, start=chunk * chunksize, stop=(chunk+1) * chunksize, selection=where, *args, **kwargs)
+                # Chunks without any entry passing `where` are skipped, so the selection is
+                # found first. Iterating then only reads the chunks containing selected entries.
+                selected = self._select(where_only=True)
+                if selected is None:
+                    return len(ranges)
+                starts, stops = np.array(ranges, dtype=np.int64).reshape(-1, 2).T
+                return int(np.count_nonzero(np.searchsorted(selected, stops) > np.searchsorted(selected, starts)))
+
+            def _iter_arrays(self):
+                selected = self._select()
+                # Keep a single chain open for the whole iteration so that files
+                # are opened once and the TTreeCache is reused between chunks
+                with _open_chain(key, file_entries) as tchain:
+                    for start, stop in ranges:
+                        arr = read_range(tchain, start, stop, selected)
+                        if arr is not None:
+                            yield stop, arr
+
+            def _iter_arrays_parallel(self):
+                selected = self._select()
+                stops = deque()
+
+                def tasks():
+                    for start, stop in ranges:
+                        task = get_task(start, stop, selected)
+                        if task is not None:
+                            stops.append(stop)
+                            yield task
+                # Keep one chunk per worker in flight while the previous one is consumed
+                window = (n_workers or multiprocessing.cpu_count()) + 1
+                for arr in read_parallel(tasks(), window):
+                    yield stops.popleft(), arr
+
+            def _iter_frames(self):
+                current_index = resume_from['index'] if resume_from is not None else 0
+                arrays = self._iter_arrays_parallel() if parallel else self._iter_arrays()
+                for stop, arr in arrays:
+                    if len(arr) == 0:
+                        continue
+                    arr = prepare(arr)
                     if len(arr) == 0:
                         continue
-                    if flatten:
-                        arr = do_flatten(arr, flatten)
-                    yield convert_to_dataframe(arr, start_index=current_index)
+                    result = convert(arr, start_index=current_index)
                     current_index += len(arr)
+                    yield result, get_position(stop, current_index)
+
+            def with_positions(self):
+                """Iterate over (chunk, position) pairs"""
+                frames = self._iter_frames()
+                if prefetch:
+                    frames = _prefetch(frames, prefetch)
+                try:
+                    for result, position in frames:
+                        self.position = position
+                        yield result, position
+                finally:
+                    # Stops the reading thread if the iteration ends early
+                    frames.close()
+                    close_executor()
 
-        return genchunk()
-
-    arr = root2array(paths, key, all_vars, selection=where, *args, **kwargs)
-    if flatten:
-        arr = do_flatten(arr, flatten)
-    return convert_to_dataframe(arr)
-
-
-def convert_to_dataframe(array, start_index=None):
-    nonscalar_columns = get_nonscalar_columns(array)
+            def __iter__(self):
+                for result, _ in self.with_positions():
+                    yield result
 
-    # Columns containing 2D arrays can't be loaded so convert them 1D arrays of arrays
-    reshaped_columns = {}
-    for col in nonscalar_columns:
-        if array[col].ndim >= 2:
-            reshaped = np.zeros(len(array[col]), dtype='O')
-            for i, row in enumerate(array[col]):
-                reshaped[i] = row
-            reshaped_columns[col] = reshaped
+        return genchunk()
 
-    indices = list(filter(lambda x: x.startswith('__index__'), array.dtype.names))
+    if lazy:
+        if sample is not None:
+            # Every column must be read for the same sample of entries
+            lazy_options.update(sample=None, seed=None, entry_list=entry_list)
+        # Formulas are passed as they were given, and branches are matched exactly
+        lazy_branches = OrderedDict()
+        for var in all_vars:
+            if var.startswith('__index__') or var.startswith(JAGGED_LENGTH_PREFIX) or var in query_vars:
+                continue
+            categorical = _parse_categorical_name(var)
+            name = categorical[0] if categorical else var
+            lazy_branches[name] = NOEXPAND_PREFIX + var if var in noexpand else var
+
+        def load(names):
+            return read_root(paths, key, columns=[lazy_branches[name] for name in names], **lazy_options)
+
+        # Without any selection, every entry of the range is a row
+        n_rows = None
+        if not where and query is None and entry_list is None and \
+                not any(name in kwargs for name in ('start', 'stop', 'step')):
+            n_rows = boundaries[-1] - boundaries[0]
+        close_executor()
+        return LazyFrame(lazy_branches, load, n_rows=n_rows)
+
+    cache_key = None
+    if cache_dir is not None:
+        cache = DataCache(cache_dir, cache_size)
+        cache_key = cache.make_key(
+            paths, version=__version__, key=key, columns=all_vars, where=where, flatten=flatten,
+            query=query.expression if query is not None else None, entries=[boundaries[0], boundaries[-1]],
+            entry_list=hashlib.sha1(entry_list.tobytes()).hexdigest() if entry_list is not None else None,
+            entry_range=entry_range, args=args, kwargs=kwargs)
+        if cache_key is not None:
+            with measure(stats, 'cache'):
+                cached = cache.load(cache_key)
+            if cached is not None:
+                close_executor()
+                return convert(cached)
+
+    if (parallel or pushdown or restricted) and n_total > 0:
+        selected = select_entries() if pushdown else None
+        if boundaries[-1] == boundaries[0]:
+            arrays = []
+        elif parallel:
+            # Split the input in a few cluster aligned ranges per worker to balance the load
+            n_tasks = 4 * (n_workers or multiprocessing.cpu_count())
+            ranges = get_chunk_ranges(boundaries, int(ceil(float(boundaries[-1] - boundaries[0]) / n_tasks)))
+            tasks = [get_task(start, stop, selected) for start, stop in ranges]
+            arrays = list(read_parallel(tasks, len(tasks)))
+        else:
+            with _open_chain(key, file_entries) as tchain:
+                arrays = [read_range(tchain, boundaries[0], boundaries[-1], selected)]
+        arrays = [arr for arr in arrays if arr is not None]
+        if arrays:
+            arr = np.concatenate(arrays)
+        else:
+            # Nothing was selected, read no entries to get the right columns
+            path = next(path for path, n_entries in file_entries if n_entries)
+            arr = root2array(path, key, all_vars, stop=0, *args, **kwargs)
+    else:
+        with measure(stats, 'read'):
+            arr = root2array(paths, key, all_vars, selection=where, *args, **kwargs)
+        if stats is not None:
+            stats.entries_read += n_total
+            stats.bytes_decompressed += arr.nbytes
+    close_executor()
+    arr = prepare(arr)
+    if cache_key is not None:
+        with measure(stats, 'cache'):
+            cache.store(cache_key, arr)
+    return convert(arr)
+
+
+def convert_to_dataframe(array, start_index=None, jagged=None, stats=None):
+    # Either a structured array or a mapping of column names to arrays
+    if isinstance(array, dict):
+        names = list(array)
+        n_rows = len(array[names[0]]) if names else 0
+    else:
+        names = array.dtype.names
+        n_rows = len(array)
+    indices = list(filter(lambda x: x.startswith('__index__'), names))
     if len(indices) == 0:
-        index = None
-        if start_index is not None:
-            index = RangeIndex(start=start_index, stop=start_index + len(array))
-        df = DataFrame.from_records(array, exclude=reshaped_columns, index=index)
+        if start_index is None:
+            start_index = 0
+        index = RangeIndex(start=start_index, stop=start_index + n_rows)
     elif len(indices) == 1:
         # We store the index under the __index__* branch, where
         # * is the name of the index
-        df = DataFrame.from_records(array, exclude=reshaped_columns, index=indices[0])
         index_name = indices[0][len('__index__'):]
         if not index_name:
             # None means the index has no name
             index_name = None
-        df.index.name = index_name
+        index = pd.Index(np.ascontiguousarray(array[indices[0]]), name=index_name)
     else:
         raise ValueError("More than one index found in file")
 
-    # Manually the columns which were reshaped
-    for key, reshaped in reshaped_columns.items():
-        df[key] = reshaped
+    # Build the DataFrame from one contiguous array per column which pandas can use without copying
+    columns = []
+    data = {}
+    for c in names:
+        if c in indices or c.startswith(JAGGED_LENGTH_PREFIX):
+            continue
+        values = array[c]
+        if jagged == 'offsets' and values.ndim >= 2:
+            values = JaggedArray.from_regular(values)
+        elif jagged == 'offsets' and values.dtype == 'O' and _is_numeric_jagged(values):
+            values = JaggedArray.from_objects(values)
+        elif values.ndim >= 2:
+            # Columns containing 2D arrays can't be loaded so convert them 1D arrays of arrays
+            reshaped = np.zeros(len(values), dtype='O')
+            for i, row in enumerate(values):
+                reshaped[i] = row
+            values = reshaped
+        elif values.dtype.kind == 'S':
+            # Strings are stored as python objects by pandas
+            values = values.astype('O')
+        else:
+            values = np.ascontiguousarray(values)
+
+        # Convert categorical columns back to categories
+        categorical = _parse_categorical_name(c)
+        if categorical:
+            c, ordered, categories = categorical
+            with measure(stats, 'categorical'):
+                values = pd.Categorical.from_codes(values, categories, ordered=ordered)
+
+        columns.append(c)
+        data[c] = values
+
+    return DataFrame(data, index=index, columns=columns, copy=False)
+
+
+def _parse_categorical_name(name):
+    """Return the name, whether it is ordered and the categories of a categorical branch, None for other branches"""
+    match = re.match(r'^__rpCaT\*([^\*]+)\*(True|False)\*', name)
+    if not match:
+        return None
+    real_name, ordered = match.groups()
+    return real_name, {'True': True, 'False': False}[ordered], name.split('*')[3:]
+
+
+def _is_numeric_jagged(values):
+    """Check if an object column contains numeric numpy arrays"""
+    if len(values) == 0:
+        return False
+    first = values[0]
+    return isinstance(first, np.ndarray) and first.dtype.kind in 'biuf'
+
+
+# Fills the rows of a variable-length array branch and its length branch, see _fill_jagged_branch
+_FILL_JAGGED_CODE = """
+#include <cstring>
+void root_pandas_fill_jagged(TBranch* length_branch, TBranch* branch, void* length, void* buffer,
+                             void* content, void* offsets, Long64_t n_rows, Long64_t row_size)
+{
+    const Long64_t* offsets_ = static_cast<const Long64_t*>(offsets);
+    for (Long64_t i = 0; i < n_rows; ++i) {
+        *static_cast<Int_t*>(length) = offsets_[i + 1] - offsets_[i];
+        std::memcpy(buffer, static_cast<const char*>(content) + offsets_[i] * row_size,
+                    (offsets_[i + 1] - offsets_[i]) * row_size);
+        length_branch->Fill();
+        branch->Fill();
+    }
+}
+"""
+_fill_jagged = None
 
-    # Reshaping can cause the order of columns to change so we have to change it back
-    if reshaped_columns:
-        # Filter to remove __index__ columns
-        columns = [c for c in array.dtype.names if c in df.columns]
-        assert len(columns) == len(df.columns), (columns, df.columns)
-        df = df.reindex(columns, axis=1, copy=False)
 
-    # Convert categorical columns back to categories
-    for c in df.columns:
-        match = re.match(r'^__rpCaT\*([^\*]+)\*(True|False)\*', c)
-        if match:
-            real_name, ordered = match.groups()
-            categories = c.split('*')[3:]
-            df[c] = pd.Categorical.from_codes(df[c], categories, ordered={'True': True, 'False': False}[ordered])
-            df.rename(index=str, columns={c: real_name}, inplace=True)
+def _get_fill_jagged():
+    """Compile the function filling variable-length array branches on first use"""
+    global _fill_jagged
+    if _fill_jagged is None:
+        ROOT.gInterpreter.Declare(_FILL_JAGGED_CODE)
+        _fill_jagged = ROOT.root_pandas_fill_jagged
+    return _fill_jagged
 
-    return df
 
+def _fill_jagged_branch(tree, name, values):
+    """Fill a JaggedArray into a variable-length array branch of tree, creating it if needed.
 
-def to_root(df, path, key='my_ttree', mode='w', store_index=True, *args, **kwargs):
+    The lengths of the arrays are stored in an additional branch. The rows are copied one by one
+    into a reusable buffer by a compiled loop, so neither an array nor a Python call is needed per
+    row. Only the branches are filled, the number of entries of the tree has to be updated with
+    `tree.SetEntries(-1)` afterwards.
     """
-    Write DataFrame to a ROOT file.
+    content = np.ascontiguousarray(values.flatten())
+    offsets = np.ascontiguousarray(values.offsets - values.offsets[0], dtype=np.int64)
+    lengths = np.diff(offsets)
+    inner_shape = content.shape[1:]
+    try:
+        type_code = ROOT_TYPE_CODES[content.dtype.str.lstrip('<>=|')]
+    except KeyError:
+        raise TypeError('Unable to store arrays of {} in column {}'.format(content.dtype, name))
+
+    length_name = JAGGED_LENGTH_PREFIX + name
+    length_buffer = np.zeros(1, dtype=np.int32)
+    buffer = np.zeros((max(1, lengths.max() if len(lengths) else 0),) + inner_shape, dtype=content.dtype)
+    length_branch = tree.GetBranch(length_name)
+    if not length_branch:
+        length_branch = tree.Branch(length_name, length_buffer, length_name + '/I')
+    else:
+        length_branch.SetAddress(length_buffer)
+    branch = tree.GetBranch(name)
+    if not branch:
+        dimensions = ''.join('[{}]'.format(d) for d in inner_shape)
+        leaflist = '{}[{}]{}/{}'.format(name, length_name, dimensions, type_code)
+        branch = tree.Branch(name, buffer, leaflist)
+    else:
+        branch.SetAddress(buffer)
 
-    Parameters
-    ----------
-    path: string
-        File path to new ROOT file (will be overwritten)
-    key: string
-        Name of tree that the DataFrame will be saved as
-    mode: string, {'w', 'a'}
-        Mode that the file should be opened in (default: 'w')
-    store_index: bool (optional, default: True)
-        Whether the index of the DataFrame should be stored as
-        an __index__* branch in the tree
+    if len(values):
+        row_size = int(np.prod(inner_shape)) * content.dtype.itemsize
+        # The content isn't read if all rows are empty, but has to be passed as a valid buffer
+        content = content if content.size else buffer
+        _get_fill_jagged()(length_branch, branch, length_buffer, buffer, content, offsets, len(values), row_size)
+    tree.ResetBranchAddresses()
 
-    Notes
-    -----
 
-    Further *args and *kwargs are passed to root_numpy's array2root.
+@contextmanager
+def _ignore_root_warnings():
+    """Don't print the warnings of ROOT, such as those of TTree::SetEntries while the branches are filled"""
+    level = ROOT.gErrorIgnoreLevel
+    ROOT.gErrorIgnoreLevel = max(level, ROOT.kError)
+    try:
+        yield
+    finally:
+        ROOT.gErrorIgnoreLevel = level
 
-    >>> df = DataFrame({'x': [1,2,3], 'y': [4,5,6]})
-    >>> df.to_root('test.root')
 
-    The DataFrame index will be saved as a branch called '__index__*',
-    where * is the name of the index in the original DataFrame
-    """
+def _open_tree(path, key, mode):
+    """Open a ROOT file and the directory of the tree `key` in it, creating the directory if needed.
 
+    Returns
+    -------
+        The file, the directory of the tree, the name of the tree within the directory and the
+        existing tree or None
+    """
     if mode == 'a':
         mode = 'update'
     elif mode == 'w':
@@ -367,35 +1618,6 @@ def to_root(df, path, key='my_ttree', mode='w', store_index=True, *args, **kwarg
     else:
         raise ValueError('Unknown mode: {}. Must be "a" or "w".'.format(mode))
 
-    column_name_counts = Counter(df.columns)
-    if max(column_name_counts.values()) > 1:
-        raise ValueError('DataFrame contains duplicated column names: ' +
-                         ' '.join({k for k, v in column_name_counts.items() if v > 1}))
-
-    from root_numpy import array2tree
-    # We don't want to modify the user's DataFrame here, so we make a shallow copy
-    df_ = df.copy(deep=False)
-
-    if store_index:
-        name = df_.index.name
-        if name is None:
-            # Handle the case where the index has no name
-            name = ''
-        df_['__index__' + name] = df_.index
-
-    # Convert categorical columns into something root_numpy can serialise
-    for col in df_.select_dtypes(['category']).columns:
-        name_components = ['__rpCaT', col, str(df_[col].cat.ordered)]
-        name_components.extend(df_[col].cat.categories)
-        if ['*' not in c for c in name_components]:
-            sep = '*'
-        else:
-            raise ValueError('Unable to find suitable separator for columns')
-        df_[col] = df_[col].cat.codes
-        df_.rename(index=str, columns={col: sep.join(name_components)}, inplace=True)
-
-    arr = df_.to_records(index=False)
-
     root_file = ROOT.TFile.Open(path, mode)
     if not root_file:
         raise IOError("cannot open file {0}".format(path))
@@ -418,9 +1640,354 @@ def to_root(df, path, key='my_ttree', mode='w', store_index=True, *args, **kwarg
     tree = open_dirs[-1].Get(key)
     if not tree:
         tree = None
-    tree = array2tree(arr, name=key, tree=tree)
-    tree.Write(key, ROOT.TFile.kOverwrite)
-    root_file.Close()
+    return root_file, open_dirs[-1], key, tree
+
+
+def get_compression_settings(compression=None, level=None):
+    """Return the ROOT compression settings (100 * algorithm + level).
+
+    Parameters
+    ----------
+    compression: {None, 'none', 'zlib', 'lzma', 'lz4', 'zstd'}
+        The compression algorithm, None keeps the default of the file
+    level: int (optional, default: None)
+        The compression level from 1 to 9, None uses the default level of the algorithm
+
+    Returns
+    -------
+        The settings, or None if neither compression nor level are given
+    """
+    if compression is None and level is None:
+        return None
+    if level is not None and not 0 <= level <= 9:
+        raise ValueError('Unknown compression level: {}. Must be between 0 and 9.'.format(level))
+    if compression == 'none' or level == 0:
+        return 0
+    if compression is None:
+        compression = 'zlib'
+    if compression not in COMPRESSION_ALGORITHMS:
+        raise ValueError('Unknown compression: {}. Must be one of {}.'.format(
+            compression, ', '.join(['none'] + sorted(COMPRESSION_ALGORITHMS))))
+    algorithm, default_level = COMPRESSION_ALGORITHMS[compression]
+    return 100 * algorithm + (default_level if level is None else level)
+
+
+def _get_branch_columns(df, store_index=True):
+    """Return the name and values of the branches to store the columns of df in.
+
+    Categorical columns are stored as their codes, with the categories encoded in the branch name.
+    """
+    column_name_counts = Counter(df.columns)
+    if max(column_name_counts.values()) > 1:
+        raise ValueError('DataFrame contains duplicated column names: ' +
+                         ' '.join({k for k, v in column_name_counts.items() if v > 1}))
+
+    columns = []
+    jagged_columns = []
+    for col in df.columns:
+        values = df[col].values
+        if JaggedArray is not None and isinstance(values, JaggedArray):
+            # Variable-length arrays are filled into the tree separately
+            jagged_columns.append((str(col), values))
+            continue
+        if df[col].dtype.name == 'category':
+            name_components = ['__rpCaT', col, str(values.ordered)]
+            name_components.extend(values.categories)
+            if any('*' in c for c in name_components):
+                raise ValueError('Unable to find suitable separator for columns')
+            col = '*'.join(name_components)
+            values = values.codes
+        columns.append((str(col), values))
+
+    if store_index:
+        name = df.index.name
+        if name is None:
+            # Handle the case where the index has no name
+            name = ''
+        columns.append(('__index__' + str(name), np.asarray(df.index)))
+    return columns, jagged_columns
+
+
+class RootWriter(object):
+    """Write DataFrames into a tree chunk by chunk, keeping the file open in between.
+
+    Every chunk is filled into the branches column by column, without copying it into a
+    record array, and the baskets are flushed to the file after each chunk, so memory use
+    doesn't grow with the number of chunks. All chunks must have the same columns and dtypes.
+
+    Parameters
+    ----------
+    path: string
+        File path to the ROOT file
+    key: string
+        Name of the tree that the DataFrames will be saved as
+    mode: string, {'w', 'a'}
+        Mode that the file should be opened in (default: 'w')
+    store_index: bool (optional, default: True)
+        Whether the index of the DataFrames should be stored as
+        an __index__* branch in the tree
+    compression: {None, 'none', 'zlib', 'lzma', 'lz4', 'zstd'}
+        The compression algorithm of the file and the branches (default: the default of ROOT)
+    level: int (optional, default: None)
+        The compression level from 1 to 9, by default the default level of the algorithm
+    basket_size: int (optional, default: None)
+        The size of the baskets of every branch in bytes (default: 32000)
+    auto_flush: int (optional, default: None)
+        If given, the baskets are flushed every `auto_flush` entries, so the tree is made of
+        clusters of this many entries. Otherwise the baskets are flushed after every chunk.
+    stats: root_pandas.instrumentation.IOStats (optional, default: None)
+        If given, the bytes and entries written and the time spent in each stage are added to
+        this object, and every appended DataFrame is recorded as a chunk.
+
+    Notes
+    -----
+
+        >>> with RootWriter('skim.root', 'tree') as writer:
+        ...     for df in read_root('big.root', chunksize=100000):
+        ...         writer.append(df[df.x > 0])
+
+    """
+
+    def __init__(self, path, key='my_ttree', mode='w', store_index=True, compression=None, level=None,
+                 basket_size=None, auto_flush=None, stats=None):
+        if basket_size is not None and basket_size <= 0:
+            raise ValueError('basket_size must be positive')
+        if auto_flush is not None and auto_flush <= 0:
+            raise ValueError('auto_flush must be a positive number of entries')
+        self.path = path
+        self.store_index = store_index
+        self.compression_settings = get_compression_settings(compression, level)
+        self.basket_size = basket_size
+        self.auto_flush = auto_flush
+        self.stats = stats
+        self._schema = None
+        with measure(stats, 'write'):
+            self._file, self._directory, self.key, self._tree = _open_tree(path, key, mode)
+        # Appended entries continue the clusters of an existing tree
+        self.n_entries = int(self._tree.GetEntries()) if self._tree is not None else 0
+        if self.compression_settings is not None:
+            self._file.SetCompressionSettings(self.compression_settings)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def append(self, df):
+        """Write the rows of a DataFrame to the tree."""
+        if self._file is None:
+            raise ValueError('Cannot append to a closed RootWriter')
+        from root_numpy import array2tree
+        with measure(self.stats, 'prepare'):
+            columns, jagged_columns = _get_branch_columns(df, self.store_index)
+            columns = [(name, np.ascontiguousarray(values)) for name, values in columns]
+        for name, values in columns:
+            if values.dtype.kind == 'O':
+                raise TypeError('Unable to store column {} of dtype object'.format(name))
+
+        schema = [(name, values.dtype.str, values.shape[1:]) for name, values in columns]
+        schema += [(name, 'jagged', values.dtype.subtype.str) for name, values in jagged_columns]
+        first_chunk = self._schema is None
+        if first_chunk:
+            self._schema = schema
+        elif schema != self._schema:
+            raise ValueError('The columns of the DataFrame ({}) differ from the first one ({})'.format(
+                ', '.join(name for name, _, _ in schema), ', '.join(name for name, _, _ in self._schema)))
+
+        # Record arrays with a single field, sharing the memory of the columns
+        views = [np.ndarray(shape=(len(values),), dtype=[(name, values.dtype, values.shape[1:])], buffer=values)
+                 for name, values in columns]
+        # A new tree is attached to the current directory, which reading other files may have changed
+        self._directory.cd()
+        if first_chunk:
+            # Create the branches before filling them, so that their settings apply to all baskets
+            with _ignore_root_warnings():
+                for view in views:
+                    self._tree = array2tree(view[:0], name=self.key, tree=self._tree)
+                for name, values in jagged_columns:
+                    _fill_jagged_branch(self._tree, name, values[:0])
+            self._configure_branches()
+
+        # Fill the rows up to the next cluster boundary at a time
+        edges = [0, len(df)]
+        if self.auto_flush:
+            first = -self.n_entries % self.auto_flush
+            edges[1:1] = range(first or self.auto_flush, len(df), self.auto_flush)
+        for start, stop in zip(edges[:-1], edges[1:]):
+            with measure(self.stats, 'fill'):
+                # array2tree updates the number of entries after every column, while the branches
+                # of the following columns are still shorter, so it is only updated once at the end
+                with _ignore_root_warnings():
+                    for view in views:
+                        self._tree = array2tree(view[start:stop], name=self.key, tree=self._tree)
+                    for name, values in jagged_columns:
+                        _fill_jagged_branch(self._tree, name, values[start:stop])
+                self._tree.SetEntries(-1)
+            self.n_entries += stop - start
+            if not self.auto_flush or self.n_entries % self.auto_flush == 0:
+                with measure(self.stats, 'flush'):
+                    self._tree.FlushBaskets()
+        if self.stats is not None:
+            self.stats.entries_written += len(df)
+            nbytes = sum(values.nbytes for _, values in columns) + sum(values.nbytes for _, values in jagged_columns)
+            self.stats.record_chunk(len(df), nbytes)
+
+    def _configure_branches(self):
+        """Apply the compression settings, basket size and auto flush to the tree and its branches"""
+        if self._tree is None:
+            return
+        if self.compression_settings is not None:
+            for branch in self._tree.GetListOfBranches():
+                branch.SetCompressionSettings(self.compression_settings)
+        if self.basket_size is not None:
+            self._tree.SetBasketSize('*', self.basket_size)
+        if self.auto_flush is not None:
+            self._tree.SetAutoFlush(self.auto_flush)
+
+    def extend(self, frames):
+        """Write all DataFrames of an iterable, such as the chunks returned by read_root."""
+        for df in frames:
+            self.append(df)
+
+    def close(self):
+        """Write the tree and close the file."""
+        if self._file is None:
+            return
+        with measure(self.stats, 'write'):
+            try:
+                if self._tree is not None:
+                    if self.auto_flush and self.n_entries % self.auto_flush:
+                        self._tree.FlushBaskets()
+                    # The tree is written to the current directory
+                    self._directory.cd()
+                    self._tree.Write(self.key, ROOT.TFile.kOverwrite)
+            finally:
+                self._file.Close()
+                self._file = None
+                self._directory = None
+
+
+def get_shard_ranges(n_entries, shards=None, max_entries_per_file=None):
+    """Split n_entries rows into `shards` ranges of similar size, or ranges of up to `max_entries_per_file` rows.
+
+    Returns
+    -------
+        A list of (start, stop) tuples
+    """
+    if (shards is None) == (max_entries_per_file is None):
+        raise ValueError('Exactly one of shards and max_entries_per_file must be given')
+    if shards is None:
+        if max_entries_per_file <= 0:
+            raise ValueError('max_entries_per_file must be positive')
+        shards = max(1, int(ceil(float(n_entries) / max_entries_per_file)))
+    elif shards <= 0:
+        raise ValueError('shards must be positive')
+    edges = [n_entries * i // shards for i in range(shards + 1)]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def get_shard_paths(path, n_shards):
+    """Return the paths of the shards of `path`, such as path_0.root, path_1.root, ..."""
+    base, extension = os.path.splitext(path)
+    width = len(str(n_shards - 1))
+    return ['{}_{:0{}d}{}'.format(base, i, width, extension) for i in range(n_shards)]
+
+
+def _write_shard(task):
+    """Write a part of a DataFrame to its own file, this is run by the workers.
+
+    Returns the path and the counters of the IOStats of the shard, if requested.
+    """
+    df, path, key, kwargs, with_stats = task
+    stats = IOStats() if with_stats else None
+    to_root(df, path, key, stats=stats, **kwargs)
+    return path, stats.as_dict() if with_stats else None
+
+
+def to_root(df, path, key='my_ttree', mode='w', store_index=True, compression=None, level=None,
+            basket_size=None, auto_flush=None, shards=None, max_entries_per_file=None, n_workers=None,
+            executor=None, stats=None, *args, **kwargs):
+    """
+    Write DataFrame to a ROOT file.
+
+    Parameters
+    ----------
+    path: string
+        File path to new ROOT file (will be overwritten)
+    key: string
+        Name of tree that the DataFrame will be saved as
+    mode: string, {'w', 'a'}
+        Mode that the file should be opened in (default: 'w')
+    store_index: bool (optional, default: True)
+        Whether the index of the DataFrame should be stored as
+        an __index__* branch in the tree
+    compression: {None, 'none', 'zlib', 'lzma', 'lz4', 'zstd'}
+        The compression algorithm of the file and the branches (default: the default of ROOT)
+    level: int (optional, default: None)
+        The compression level from 1 to 9, by default the default level of the algorithm
+    basket_size: int (optional, default: None)
+        The size of the baskets of every branch in bytes (default: 32000)
+    auto_flush: int (optional, default: None)
+        If given, the tree is written in clusters of `auto_flush` entries
+    shards: int (optional, default: None)
+        If given, the rows are split into `shards` parts of similar size, which are written
+        to the files path_0.root, path_1.root, ... (with zero-padded numbers) in parallel.
+    max_entries_per_file: int (optional, default: None)
+        Like shards, but the number of files is chosen so that each one contains up to
+        `max_entries_per_file` rows.
+    n_workers: int (optional, default: None)
+        The number of processes writing shards, by default one per CPU
+    executor: object (optional, default: None)
+        An existing executor to write the shards with instead of creating a process pool,
+        such as a `concurrent.futures.ProcessPoolExecutor` or a `multiprocessing.Pool`.
+    stats: root_pandas.instrumentation.IOStats (optional, default: None)
+        If given, the bytes and entries written and the time spent in each stage are added to
+        this object. The counters of shards written by worker processes are added as well.
+
+    Returns
+    -------
+        The list of written files if the DataFrame is written in shards, otherwise None
+
+    Notes
+    -----
+
+    Further *args and *kwargs are passed to root_numpy's array2root.
+
+    >>> df = DataFrame({'x': [1,2,3], 'y': [4,5,6]})
+    >>> df.to_root('test.root')
+
+    The DataFrame index will be saved as a branch called '__index__*',
+    where * is the name of the index in the original DataFrame
+    """
+
+    if mode not in ('a', 'w'):
+        raise ValueError('Unknown mode: {}. Must be "a" or "w".'.format(mode))
+
+    writer_kwargs = dict(mode=mode, store_index=store_index, compression=compression, level=level,
+                         basket_size=basket_size, auto_flush=auto_flush)
+    if shards is not None or max_entries_per_file is not None:
+        ranges = get_shard_ranges(len(df), shards, max_entries_per_file)
+        shard_paths = get_shard_paths(path, len(ranges))
+        tasks = ((df.iloc[start:stop], shard_path, key, writer_kwargs, stats is not None)
+                 for (start, stop), shard_path in zip(ranges, shard_paths))
+        if n_workers is None and executor is None:
+            n_workers = min(len(ranges), multiprocessing.cpu_count())
+        with _get_executor(n_workers, executor) as executor_:
+            if executor_ is None:
+                results = list(map(_write_shard, tasks))
+            else:
+                # Limit the number of parts waiting to be sent to the workers
+                window = (n_workers or multiprocessing.cpu_count()) + 1
+                results = list(_ordered_map(executor_, _write_shard, tasks, window))
+        if stats is not None:
+            for _, counters in results:
+                stats.merge(counters)
+        return [shard_path for shard_path, _ in results]
+
+    # Each column is filled directly from its own buffer, without building a record array
+    with RootWriter(path, key, stats=stats, **writer_kwargs) as writer:
+        writer.append(df)
 
 
 # Patch pandas DataFrame to support to_root method
@@ -22,12 +22,23 @@
 #
 
 import numpy as np
-VLEN = np.vectorize(len)
 
 
-def stretch(arr, fields=None, return_indices=False):
+def array_lengths(column):
+    """Return the lengths of the arrays in a variable-length (object) column."""
+    return np.fromiter((len(x) for x in column), dtype=np.int64, count=len(column))
+
+
+def lengths_to_offsets(lengths):
+    """Convert array lengths into offsets, such that array i is content[offsets[i]:offsets[i+1]]."""
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+
+def stretch(arr, fields=None, return_indices=False, index_field=None):
     """Stretch an array.
-    Stretch an array by ``hstack()``-ing  multiple array fields while
+    Stretch an array by concatenating multiple array fields while
     preserving column names and record array structure. If a scalar field is
     specified, it will be stretched along with array fields.
     Parameters
@@ -41,6 +52,9 @@ def stretch(arr, fields=None, return_indices=False):
         returned in addition to the stretched array.
         This changes the return type of this function to a tuple consisting
         of a structured array and a numpy int64 array.
+    index_field : str, optional (default=None)
+        If given, the array index of each stretched array entry is stored
+        in an additional int64 field with this name.
     Returns
     -------
     ret : A NumPy structured array
@@ -68,19 +82,20 @@ def stretch(arr, fields=None, return_indices=False):
         if dt == 'O' or len(dt.shape):
             if dt == 'O':
                 # Variable-length array field
-                lengths = VLEN(arr[field])
+                lengths = array_lengths(arr[field])
             else:
-                lengths = np.repeat(dt.shape[0], arr.shape[0])
-            # Fixed-length array field
+                # Fixed-length array field
+                lengths = np.full(arr.shape[0], dt.shape[0], dtype=np.int64)
             if len_array is None:
                 len_array = lengths
             elif not np.array_equal(lengths, len_array):
                 raise ValueError(
                     "inconsistent lengths of array columns in input")
             if dt == 'O':
-                dtype.append((field, arr[field][0].dtype))
+                first = arr[field][0]
+                dtype.append((field, first.dtype, first.shape[1:]))
             else:
-                dtype.append((field, arr[field].dtype, dt.shape[1:]))
+                dtype.append((field, dt.base, dt.shape[1:]))
         else:
             # Scalar field
             dtype.append((field, dt))
@@ -88,22 +103,30 @@ def stretch(arr, fields=None, return_indices=False):
     if len_array is None:
         raise RuntimeError("no array column in input")
 
+    offsets = lengths_to_offsets(len_array)
+    # The index of each element within its array, without building one arange per entry
+    idx = np.arange(offsets[-1]) - np.repeat(offsets[:-1], len_array)
+    if index_field is not None:
+        dtype.append((index_field, idx.dtype))
+
     # Build stretched output
-    ret = np.empty(np.sum(len_array), dtype=dtype)
+    ret = np.empty(offsets[-1], dtype=dtype)
     for field in fields:
         dt = arr.dtype[field]
-        if dt == 'O' or len(dt.shape) == 1:
-            # Variable-length or 1D fixed-length array field
-            ret[field] = np.hstack(arr[field])
+        if dt == 'O':
+            # Variable-length array field
+            if len(ret):
+                ret[field] = np.concatenate(arr[field])
         elif len(dt.shape):
-            # Multidimensional fixed-length array field
-            ret[field] = np.vstack(arr[field])
+            # Fixed-length array field
+            ret[field] = arr[field].reshape((-1,) + dt.shape[1:])
         else:
             # Scalar field
             ret[field] = np.repeat(arr[field], len_array)
+    if index_field is not None:
+        ret[index_field] = idx
 
     if return_indices:
-        idx = np.concatenate(list(map(np.arange, len_array)))
         return ret, idx
 
     return ret
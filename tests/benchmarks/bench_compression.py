@@ -0,0 +1,82 @@
+"""
+Benchmark the compression settings of to_root.
+
+For every setting a DataFrame is written with to_root and read back with
+read_root, reporting the write and read throughput of the uncompressed data
+and the size of the file.
+
+    python tests/benchmarks/bench_compression.py --columns 20 --entries 1000000
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from root_pandas import read_root, to_root
+from root_pandas.readwrite import get_compression_settings
+
+from common import temporary_directory
+
+
+SETTINGS = [
+    ('none', None),
+    ('zlib', 1),
+    ('zlib', 6),
+    ('lzma', 7),
+    ('lz4', 4),
+    ('zstd', 5),
+    ('zstd', 9),
+]
+
+
+def make_dataframe(n_columns, n_entries, seed=42):
+    """Create a DataFrame with columns of different compressibility."""
+    rng = np.random.RandomState(seed)
+    data = {}
+    for i in range(n_columns):
+        if i % 3 == 0:
+            data['column_{}'.format(i)] = rng.normal(0, 1, n_entries)
+        elif i % 3 == 1:
+            data['column_{}'.format(i)] = rng.poisson(3, n_entries).astype(np.int32)
+        else:
+            data['column_{}'.format(i)] = np.round(rng.uniform(0, 100, n_entries), 1).astype(np.float32)
+    return pd.DataFrame(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--columns', type=int, default=20)
+    parser.add_argument('--entries', type=int, default=1000000)
+    parser.add_argument('--basket-size', type=int, default=None)
+    parser.add_argument('--auto-flush', type=int, default=None)
+    parser.add_argument('--directory', default=None, help='where to write the temporary files')
+    args = parser.parse_args()
+
+    df = make_dataframe(args.columns, args.entries)
+    nbytes = df.memory_usage(index=True, deep=False).sum()
+    print('{:>12} {:>9} {:>14} {:>13} {:>10} {:>7}'.format(
+        'compression', 'settings', 'write [MB/s]', 'read [MB/s]', 'file [MB]', 'ratio'))
+    with temporary_directory(args.directory) as directory:
+        path = os.path.join(directory, 'bench_compression.root')
+        for compression, level in SETTINGS:
+            start = time.time()
+            to_root(df, path, key='tree', compression=compression, level=level,
+                    basket_size=args.basket_size, auto_flush=args.auto_flush)
+            write_time = time.time() - start
+            file_size = os.path.getsize(path)
+
+            start = time.time()
+            df_ = read_root(path, key='tree')
+            read_time = time.time() - start
+            assert len(df_) == len(df)
+
+            print('{:>12} {:>9} {:>14.1f} {:>13.1f} {:>10.1f} {:>7.2f}'.format(
+                compression, get_compression_settings(compression, level), nbytes / 1e6 / write_time,
+                nbytes / 1e6 / read_time, file_size / 1e6, float(nbytes) / file_size))
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Benchmark the conversion of wide structured arrays into DataFrames.
+
+Every measurement runs in a fresh process so that the reported peak resident
+set size only contains the array being converted and the conversion itself.
+The previous implementation based on ``DataFrame.from_records`` is measured
+as a reference.
+
+    python tests/benchmarks/bench_convert_to_dataframe.py --branches 500 --entries 100000
+"""
+import argparse
+import re
+import time
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame, RangeIndex
+
+from root_pandas.readwrite import convert_to_dataframe, get_nonscalar_columns
+
+from common import max_rss_bytes, run_in_process
+
+
+def legacy_convert_to_dataframe(array, start_index=None):
+    """convert_to_dataframe as implemented in root_pandas 0.7.0"""
+    nonscalar_columns = get_nonscalar_columns(array)
+
+    reshaped_columns = {}
+    for col in nonscalar_columns:
+        if array[col].ndim >= 2:
+            reshaped = np.zeros(len(array[col]), dtype='O')
+            for i, row in enumerate(array[col]):
+                reshaped[i] = row
+            reshaped_columns[col] = reshaped
+
+    indices = list(filter(lambda x: x.startswith('__index__'), array.dtype.names))
+    if len(indices) == 0:
+        index = None
+        if start_index is not None:
+            index = RangeIndex(start=start_index, stop=start_index + len(array))
+        df = DataFrame.from_records(array, exclude=reshaped_columns, index=index)
+    else:
+        df = DataFrame.from_records(array, exclude=reshaped_columns, index=indices[0])
+        df.index.name = indices[0][len('__index__'):] or None
+
+    for key, reshaped in reshaped_columns.items():
+        df[key] = reshaped
+
+    if reshaped_columns:
+        columns = [c for c in array.dtype.names if c in df.columns]
+        df = df.reindex(columns, axis=1, copy=False)
+
+    for c in df.columns:
+        match = re.match(r'^__rpCaT\*([^\*]+)\*(True|False)\*', c)
+        if match:
+            real_name, ordered = match.groups()
+            categories = c.split('*')[3:]
+            df[c] = pd.Categorical.from_codes(df[c], categories, ordered={'True': True, 'False': False}[ordered])
+            df.rename(index=str, columns={c: real_name}, inplace=True)
+
+    return df
+
+
+IMPLEMENTATIONS = {
+    'legacy': legacy_convert_to_dataframe,
+    'current': convert_to_dataframe,
+}
+
+
+def make_array(n_branches, n_entries, seed=42):
+    """Create a wide structured array resembling the output of root2array."""
+    rng = np.random.RandomState(seed)
+    dtypes = ['f8', 'f4', 'i4', 'i8', '?']
+    fields = [('__index__', 'i8'), ('__rpCaT*category*False*a*b*c', 'i1')]
+    fields += [('branch_{}'.format(i), dtypes[i % len(dtypes)]) for i in range(n_branches)]
+    array = np.empty(n_entries, dtype=fields)
+    array['__index__'] = np.arange(n_entries)
+    array['__rpCaT*category*False*a*b*c'] = rng.randint(0, 3, n_entries)
+    for name, dtype in fields[2:]:
+        array[name] = rng.uniform(0, 100, n_entries).astype(dtype)
+    return array
+
+
+def measure(name, n_branches, n_entries, results):
+    array = make_array(n_branches, n_entries)
+    rss_before = max_rss_bytes()
+    start = time.time()
+    df = IMPLEMENTATIONS[name](array)
+    elapsed = time.time() - start
+    assert df.shape == (n_entries, n_branches + 1)
+    results.put((elapsed, rss_before, max_rss_bytes(), array.nbytes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--branches', type=int, nargs='+', default=[10, 100, 500, 1000])
+    parser.add_argument('--entries', type=int, default=100000)
+    args = parser.parse_args()
+
+    print('{:>9} {:>8} {:>10} {:>10} {:>12} {:>12}'.format(
+        'branches', 'impl', 'time [s]', 'data [MB]', 'peak [MB]', 'peak/data'))
+    for n_branches in args.branches:
+        for name in ['legacy', 'current']:
+            elapsed, rss_before, rss_after, nbytes = run_in_process(measure, name, n_branches, args.entries)
+            # The peak relative to the input array, including the array itself
+            peak = rss_after - rss_before + nbytes
+            print('{:>9} {:>8} {:>10.3f} {:>10.1f} {:>12.1f} {:>12.2f}'.format(
+                n_branches, name, elapsed, nbytes / 1e6, peak / 1e6, float(peak) / nbytes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+"""
+Benchmark suite for the hot paths of read_root and to_root.
+
+Synthetic trees (narrow, wide, fixed-size arrays and variable-length arrays, with
+categorical columns and an __index__ branch) are written to a temporary directory.
+Every benchmark runs in a fresh process and reports the best time of several
+repeats, the throughput relative to the size of the data in memory, the increase
+of the peak resident set size and the time spent in each stage as recorded by
+IOStats. Results can be saved as a baseline, and later runs compared against it:
+
+    python tests/benchmarks/bench_suite.py --save baseline.json
+    python tests/benchmarks/bench_suite.py --compare baseline.json --threshold 1.25
+
+The comparison exits with status 1 if any benchmark is slower than the baseline
+by more than the threshold. Baselines are only comparable on the same machine,
+so none is stored in the repository: to review a change, save a baseline from
+the target branch and compare the change against it on the same machine.
+"""
+from collections import OrderedDict
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from root_numpy import array2root, root2array
+
+import root_pandas
+from root_pandas import read_root
+from root_pandas.instrumentation import IOStats
+from root_pandas.jagged import JaggedArray
+from root_pandas.readwrite import convert_to_dataframe
+from root_pandas.utils import stretch
+
+from common import max_rss_bytes, run_in_process, temporary_directory
+
+
+def make_scalars(n_columns, n_entries, rng):
+    """Return a dict of scalar columns of different dtypes and a categorical column."""
+    dtypes = ['f8', 'f4', 'i4', 'i8', '?']
+    data = OrderedDict()
+    for i in range(n_columns):
+        data['x{}'.format(i)] = rng.uniform(0, 100, n_entries).astype(dtypes[i % len(dtypes)])
+    data['category'] = pd.Categorical.from_codes(rng.randint(0, 3, n_entries), ['a', 'b', 'c'])
+    return data
+
+
+def write_narrow(path, n_entries, rng):
+    df = pd.DataFrame(make_scalars(10, n_entries, rng))
+    df.index.name = 'event'
+    df.to_root(path, key='tree')
+
+
+def write_wide(path, n_entries, rng):
+    df = pd.DataFrame(make_scalars(500, n_entries, rng))
+    df.index.name = 'event'
+    df.to_root(path, key='tree')
+
+
+def write_fixed(path, n_entries, rng):
+    array = np.empty(n_entries, dtype=[('__index__event', 'i8'), ('x0', 'f8'), ('n', 'i4'), ('x', 'f8', (4,))])
+    array['__index__event'] = np.arange(n_entries)
+    array['x0'] = rng.uniform(0, 100, n_entries)
+    array['n'] = rng.randint(0, 10, n_entries)
+    array['x'] = rng.normal(size=(n_entries, 4))
+    array2root(array, path, 'tree', mode='recreate')
+
+
+def write_jagged(path, n_entries, rng):
+    data = make_scalars(5, n_entries, rng)
+    lengths = rng.poisson(4, n_entries)
+    data['x'] = JaggedArray(rng.normal(size=lengths.sum()), np.concatenate([[0], np.cumsum(lengths)]))
+    df = pd.DataFrame(data)
+    df.index.name = 'event'
+    df.to_root(path, key='tree')
+
+
+# The functions writing every dataset and the fraction of the requested entries it contains
+DATASETS = OrderedDict([
+    ('narrow', (write_narrow, 1.)),
+    ('wide', (write_wide, 0.05)),
+    ('fixed', (write_fixed, 1.)),
+    ('jagged', (write_jagged, 0.5)),
+])
+N_FILES = 4
+
+
+def setup_paths(paths):
+    return (paths,)
+
+
+def setup_array(paths):
+    return (root2array(paths[0], 'tree'),)
+
+
+def setup_dataframe(paths):
+    return read_root(paths[0], 'tree'), os.path.join(os.path.dirname(paths[0]), 'new.root')
+
+
+def setup_append(paths):
+    df = read_root(paths[0], 'tree')
+    path = os.path.join(os.path.dirname(paths[0]), 'append.root')
+    df.to_root(path, key='tree')
+    return df, path
+
+
+def run_read(paths, stats):
+    return len(read_root(paths[0], 'tree', stats=stats))
+
+
+def run_read_chunked(paths, stats):
+    return sum(len(df) for df in read_root(paths[0], 'tree', chunksize=100000, stats=stats))
+
+
+def run_read_where(paths, stats):
+    return len(read_root(paths[0], 'tree', where='x0 > 50', stats=stats))
+
+
+def run_read_flatten(paths, stats):
+    return len(read_root(paths[0], 'tree', flatten=['x'], stats=stats))
+
+
+def run_read_files(paths, stats):
+    return len(read_root(paths, 'tree', stats=stats))
+
+
+def run_convert(array, stats):
+    return len(convert_to_dataframe(array, stats=stats))
+
+
+def run_stretch(array, stats):
+    return len(stretch(array, index_field='__array_index'))
+
+
+def run_to_root(df, path, stats):
+    df.to_root(path, key='tree', stats=stats)
+    return len(df)
+
+
+def run_to_root_append(df, path, stats):
+    df.to_root(path, key='tree', mode='a', stats=stats)
+    return len(df)
+
+
+# The datasets, setup and function of every benchmark
+BENCHMARKS = OrderedDict([
+    ('read', (['narrow', 'wide', 'fixed', 'jagged'], setup_paths, run_read)),
+    ('read_chunked', (['narrow', 'wide', 'jagged'], setup_paths, run_read_chunked)),
+    ('read_where', (['narrow', 'wide', 'fixed'], setup_paths, run_read_where)),
+    ('read_flatten', (['fixed', 'jagged'], setup_paths, run_read_flatten)),
+    ('read_files', (['narrow', 'jagged'], setup_paths, run_read_files)),
+    ('convert_to_dataframe', (['narrow', 'wide', 'fixed', 'jagged'], setup_array, run_convert)),
+    ('stretch', (['fixed', 'jagged'], setup_array, run_stretch)),
+    ('to_root', (['narrow', 'wide', 'jagged'], setup_dataframe, run_to_root)),
+    ('to_root_append', (['narrow', 'jagged'], setup_append, run_to_root_append)),
+])
+
+
+def measure(name, paths, repeat, results):
+    _, setup, run = BENCHMARKS[name]
+    args = setup(paths)
+    nbytes = read_root(paths[0], 'tree').memory_usage(index=True, deep=False).sum()
+    if name == 'read_files':
+        nbytes *= len(paths)
+    rss_before = max_rss_bytes()
+    best = None
+    for _ in range(repeat):
+        stats = IOStats()
+        start = time.time()
+        rows = run(*args, stats=stats)
+        elapsed = time.time() - start
+        if best is None or elapsed < best[0]:
+            best = elapsed, stats.timings
+    elapsed, timings = best
+    results.put({
+        'time': elapsed,
+        'rows': rows,
+        'throughput': nbytes / 1e6 / elapsed,
+        'peak_rss': (max_rss_bytes() - rss_before) / 1e6,
+        'timings': timings,
+    })
+
+
+def write_datasets(directory, n_entries, names):
+    """Write every dataset into N_FILES files and return their paths."""
+    paths = {}
+    for name in names:
+        write, fraction = DATASETS[name]
+        paths[name] = []
+        for i in range(N_FILES):
+            path = os.path.join(directory, '{}_{}.root'.format(name, i))
+            write(path, max(1, int(n_entries * fraction)), np.random.RandomState(i))
+            paths[name].append(path)
+    return paths
+
+
+def compare(results, baseline, threshold):
+    """Print the ratio of the times to the baseline and return the names of the regressions."""
+    regressions = []
+    print('\n{:>32} {:>10} {:>10} {:>8}'.format('benchmark', 'time [s]', 'base [s]', 'ratio'))
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result['time'] / baseline[name]['time']
+        flag = ''
+        if ratio > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print('{:>32} {:>10.3f} {:>10.3f} {:>8.2f}{}'.format(name, result['time'], baseline[name]['time'], ratio, flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--entries', type=int, default=1000000, help='the number of entries per file')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', nargs='+', default=None, help='only run these benchmarks')
+    parser.add_argument('--directory', default=None, help='where to write the temporary files')
+    parser.add_argument('--save', default=None, help='save the results as JSON to this file')
+    parser.add_argument('--compare', default=None, help='compare the results to this JSON file')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='the ratio of the time to the baseline above which a benchmark is a regression')
+    args = parser.parse_args()
+
+    names = args.only or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error('Unknown benchmarks: {}'.format(', '.join(unknown)))
+    datasets = sorted(set(dataset for name in names for dataset in BENCHMARKS[name][0]))
+
+    results = OrderedDict()
+    with temporary_directory(args.directory) as directory:
+        paths = write_datasets(directory, args.entries, datasets)
+        print('{:>32} {:>10} {:>10} {:>10}  {}'.format('benchmark', 'time [s]', 'MB/s', 'peak [MB]', 'stages'))
+        for name in names:
+            for dataset in BENCHMARKS[name][0]:
+                result = run_in_process(measure, name, paths[dataset], args.repeat)
+                key = '{}[{}]'.format(name, dataset)
+                results[key] = result
+                stages = ', '.join('{}={:.3f}'.format(stage, elapsed)
+                                   for stage, elapsed in sorted(result['timings'].items(), key=lambda x: -x[1]))
+                print('{:>32} {:>10.3f} {:>10.1f} {:>10.1f}  {}'.format(
+                    key, result['time'], result['throughput'], result['peak_rss'], stages))
+
+    if args.save:
+        with open(args.save, 'w') as output:
+            json.dump({
+                'environment': {
+                    'python': platform.python_version(),
+                    'numpy': np.__version__,
+                    'pandas': pd.__version__,
+                    'root_pandas': root_pandas.__version__,
+                    'machine': platform.machine(),
+                    'entries': args.entries,
+                },
+                'results': results,
+            }, output, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline['environment'].get('entries') != args.entries:
+            print('Warning: the baseline was measured with {} entries'.format(baseline['environment'].get('entries')))
+        regressions = compare(results, baseline['results'], args.threshold)
+        if regressions:
+            print('\n{} regression(s): {}'.format(len(regressions), ', '.join(regressions)))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark writing wide DataFrames with to_root.
+
+Every measurement runs in a fresh process so that the reported peak resident
+set size only contains the DataFrame being written and the writing itself.
+The previous implementation, which copies the DataFrame into a record array
+with ``to_records`` before calling ``array2tree``, is measured as a reference.
+
+    python tests/benchmarks/bench_to_root.py --columns 100 --entries 10000000
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import ROOT
+from root_numpy import array2tree
+
+from root_pandas import to_root
+
+from common import max_rss_bytes, run_in_process, temporary_directory
+
+
+def legacy_to_root(df, path, key='my_ttree', store_index=True):
+    """to_root as implemented in root_pandas 0.7.0, without support for appending and directories"""
+    df_ = df.copy(deep=False)
+
+    if store_index:
+        name = df_.index.name
+        if name is None:
+            name = ''
+        df_['__index__' + name] = df_.index
+
+    for col in df_.select_dtypes(['category']).columns:
+        name_components = ['__rpCaT', col, str(df_[col].cat.ordered)]
+        name_components.extend(df_[col].cat.categories)
+        df_[col] = df_[col].cat.codes
+        df_.rename(index=str, columns={col: '*'.join(name_components)}, inplace=True)
+
+    arr = df_.to_records(index=False)
+
+    root_file = ROOT.TFile.Open(path, 'recreate')
+    tree = array2tree(arr, name=key)
+    tree.Write(key, ROOT.TFile.kOverwrite)
+    root_file.Close()
+
+
+IMPLEMENTATIONS = {
+    'legacy': legacy_to_root,
+    'current': to_root,
+}
+
+
+def make_dataframe(n_columns, n_entries, seed=42):
+    """Create a wide DataFrame with a mix of dtypes and a categorical column."""
+    rng = np.random.RandomState(seed)
+    dtypes = ['f8', 'f4', 'i4', 'i8', '?']
+    data = {}
+    for i in range(n_columns - 1):
+        data['column_{}'.format(i)] = rng.uniform(0, 100, n_entries).astype(dtypes[i % len(dtypes)])
+    data['category'] = pd.Categorical.from_codes(rng.randint(0, 3, n_entries), ['a', 'b', 'c'])
+    return pd.DataFrame(data)
+
+
+def measure(name, n_columns, n_entries, path, results):
+    df = make_dataframe(n_columns, n_entries)
+    nbytes = df.memory_usage(index=True, deep=False).sum()
+    rss_before = max_rss_bytes()
+    start = time.time()
+    IMPLEMENTATIONS[name](df, path, key='tree')
+    elapsed = time.time() - start
+    results.put((elapsed, rss_before, max_rss_bytes(), nbytes, os.path.getsize(path)))
+
+
+def run(name, n_columns, n_entries, directory):
+    path = os.path.join(directory, '{}.root'.format(name))
+    result = run_in_process(measure, name, n_columns, n_entries, path)
+    os.remove(path)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--columns', type=int, nargs='+', default=[100])
+    parser.add_argument('--entries', type=int, default=10000000)
+    parser.add_argument('--directory', default=None, help='where to write the temporary files')
+    args = parser.parse_args()
+
+    print('{:>8} {:>8} {:>10} {:>10} {:>12} {:>12} {:>10}'.format(
+        'columns', 'impl', 'time [s]', 'data [MB]', 'peak [MB]', 'peak/data', 'file [MB]'))
+    with temporary_directory(args.directory) as directory:
+        for n_columns in args.columns:
+            for name in ['legacy', 'current']:
+                elapsed, rss_before, rss_after, nbytes, file_size = run(name, n_columns, args.entries, directory)
+                # The peak relative to the DataFrame, including the DataFrame itself
+                peak = rss_after - rss_before + nbytes
+                print('{:>8} {:>8} {:>10.3f} {:>10.1f} {:>12.1f} {:>12.2f} {:>10.1f}'.format(
+                    n_columns, name, elapsed, nbytes / 1e6, peak / 1e6, float(peak) / nbytes, file_size / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""
+Helpers shared by the benchmarks.
+
+Measurements run in a fresh process, so that the peak resident set size they
+report only contains the data of the measurement itself.
+"""
+from contextlib import contextmanager
+import multiprocessing
+import resource
+import shutil
+import sys
+import tempfile
+
+
+def max_rss_bytes():
+    """Return the peak resident set size of the current process in bytes."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def run_in_process(target, *args):
+    """Call `target(*args, results)` in a fresh process and return the value it puts into the `results` queue."""
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=target, args=args + (results,))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+@contextmanager
+def temporary_directory(directory=None):
+    """Use the given directory, or a temporary directory which is removed afterwards."""
+    if directory is not None:
+        yield directory
+        return
+    directory = tempfile.mkdtemp()
+    try:
+        yield directory
+    finally:
+        shutil.rmtree(directory)
@@ -1,11 +1,14 @@
 import pandas as pd
-from root_pandas import read_root, to_root
+from root_pandas import read_root, to_root, RootWriter
 from root_numpy import list_branches
 from root_numpy import array2root
 from pandas.util.testing import assert_frame_equal
 import numpy as np
 import ROOT
+import json
+import multiprocessing
 import os
+import time
 import warnings
 from nose.tools import assert_raises
 
@@ -74,6 +77,124 @@ def test_persistent_index():
     os.remove('tmp.root')
 
 
+def test_root_writer():
+    from root_pandas import metadata_cache
+    from root_pandas.readwrite import _scan_files
+    df = pd.DataFrame({'x': np.arange(10), 'y': np.arange(10) * 0.5,
+                       'c': pd.Categorical(['a', 'b'] * 5)})
+    df.index.name = 'event'
+
+    with RootWriter('tmp.root', 'tree') as writer:
+        writer.append(df.iloc[:4])
+        writer.append(df.iloc[4:])
+        assert writer.n_entries == 10
+        # All chunks need the same columns
+        with assert_raises(ValueError):
+            writer.append(df[['x']])
+    assert_frame_equal(df, read_root('tmp.root'))
+
+    # Chunks can be streamed from read_root into another file
+    with RootWriter('tmp2.root', 'skim') as writer:
+        writer.extend(chunk[chunk.x % 2 == 0] for chunk in read_root('tmp.root', chunksize=3))
+    assert_frame_equal(df[df.x % 2 == 0], read_root('tmp2.root'))
+
+    with RootWriter('tmp2.root', 'skim', mode='a') as writer:
+        assert writer.n_entries == 5
+        writer.append(df.iloc[:2])
+        assert writer.n_entries == 7
+    assert len(read_root('tmp2.root')) == 7
+
+    # Opening other files before the first chunk changes the current ROOT directory
+    df.to_root('tmp3.root', 'tree')
+    metadata_cache.clear()
+    with RootWriter('tmp2.root', 'dir/skim') as writer:
+        for chunk in read_root('tmp3.root', chunksize=3):
+            writer.append(chunk)
+            read_root('tmp.root', columns=['x'])
+    assert_frame_equal(df, read_root('tmp2.root', 'dir/skim'))
+    # Trees in directories are found by their path
+    metadata_cache.clear()
+    file_entries, boundaries, missing = _scan_files(['tmp2.root', 'tmp3.root'], 'dir/skim')
+    assert file_entries == [('tmp2.root', 10), ('tmp3.root', 0)]
+    assert boundaries[-1] == 10
+    assert missing == ['tmp3.root']
+
+    os.remove('tmp.root')
+    os.remove('tmp2.root')
+    os.remove('tmp3.root')
+
+
+def test_to_root_compression():
+    from root_pandas.readwrite import get_cluster_boundaries
+    df = pd.DataFrame({'x': np.arange(25), 'y': np.arange(25) * 0.5})
+
+    for compression, settings in [('zlib', 101), ('lzma', 207), ('lz4', 404), ('zstd', 505)]:
+        df.to_root('tmp.root', compression=compression)
+        assert_frame_equal(df, read_root('tmp.root'))
+        root_file = ROOT.TFile.Open('tmp.root')
+        assert root_file.Get('my_ttree').GetBranch('x').GetCompressionSettings() == settings
+        root_file.Close()
+
+    df.to_root('tmp.root', compression='lz4', level=9, basket_size=16000, auto_flush=10)
+    assert_frame_equal(df, read_root('tmp.root'))
+    root_file = ROOT.TFile.Open('tmp.root')
+    branch = root_file.Get('my_ttree').GetBranch('y')
+    assert branch.GetCompressionSettings() == 409
+    assert branch.GetBasketSize() == 16000
+    root_file.Close()
+    assert get_cluster_boundaries('tmp.root', 'my_ttree') == (25, [0, 10, 20, 25])
+
+    with assert_raises(ValueError):
+        df.to_root('tmp.root', compression='gzip')
+
+    os.remove('tmp.root')
+
+
+def test_to_root_shards():
+    df = pd.DataFrame({'x': np.arange(25), 'y': np.arange(25) * 0.5}, index=np.arange(25) * 2)
+    df.index.name = 'event'
+
+    paths = df.to_root('tmp.root', shards=3, n_workers=2)
+    assert paths == ['tmp_0.root', 'tmp_1.root', 'tmp_2.root']
+    assert_frame_equal(df, read_root(paths))
+    for path in paths:
+        os.remove(path)
+
+    paths = to_root(df, 'tmp.root', max_entries_per_file=8, store_index=False)
+    assert [len(read_root(path)) for path in paths] == [6, 6, 6, 7]
+    assert_frame_equal(df.reset_index(drop=True), read_root(paths))
+    for path in paths:
+        os.remove(path)
+
+    with assert_raises(ValueError):
+        df.to_root('tmp.root', shards=2, max_entries_per_file=10)
+
+
+def test_read_glob_and_directory():
+    import shutil
+    import tempfile
+    df = pd.DataFrame({'x': np.arange(30), 'y': np.arange(30) * 0.5})
+    directory = tempfile.mkdtemp()
+    try:
+        paths = df.to_root(os.path.join(directory, 'part.root'), key='tree', shards=3)
+        assert_frame_equal(df, read_root(os.path.join(directory, 'part_*.root')))
+        assert_frame_equal(df, read_root(directory, key='tree'))
+
+        # Files without the tree are skipped
+        df.to_root(os.path.join(directory, 'other.root'), key='other')
+        assert_frame_equal(df, read_root(directory, key='tree'))
+        assert_frame_equal(df, pd.concat(list(read_root(directory, key='tree', chunksize=7))))
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            read_root([os.path.join(directory, 'other.root')] + paths, key='tree', warn_missing_tree=True)
+            assert len(caught) == 1
+
+        with assert_raises(IOError):
+            read_root(os.path.join(directory, 'missing_*.root'))
+    finally:
+        shutil.rmtree(directory)
+
+
 def test_chunked_reading():
     df = pd.DataFrame({'x': [1, 2, 3, 4, 5, 6]})
     df.to_root('tmp.root')
@@ -127,6 +248,377 @@ def test_multiple_files():
     os.remove('tmp3.root')
 
 
+def test_chunked_reading_alignment():
+    df = pd.DataFrame({'x': [1, 2, 3, 4, 5, 6]})
+    df.to_root('tmp1.root')
+    df.to_root('tmp2.root')
+    df.to_root('tmp3.root')
+    paths = ['tmp1.root', 'tmp2.root', 'tmp3.root']
+
+    # By default chunks don't span several files
+    chunks = read_root(paths, chunksize=4)
+    lengths = [len(df_) for df_ in chunks]
+    assert lengths == [4, 2, 4, 2, 4, 2]
+    assert len(chunks) == len(lengths)
+
+    chunks = read_root(paths, chunksize=4, chunk_align='entries')
+    lengths = [len(df_) for df_ in chunks]
+    assert lengths == [4, 4, 4, 4, 2]
+    assert len(chunks) == len(lengths)
+
+    with assert_raises(ValueError):
+        read_root(paths, chunksize=4, chunk_align='baskets')
+
+    os.remove('tmp1.root')
+    os.remove('tmp2.root')
+    os.remove('tmp3.root')
+
+
+def test_chunked_reading_clusters():
+    from root_pandas.readwrite import _get_file_metadata, _scan_files
+    df = pd.DataFrame({'x': np.arange(50), 'y': np.arange(50) * 0.5})
+    paths = ['tmp1.root', 'tmp2.root']
+    # Files of 25 entries in clusters of 10, 10 and 5 entries
+    for i, path in enumerate(paths):
+        df.iloc[i*25:(i+1)*25].to_root(path, store_index=False, auto_flush=10)
+
+    file_entries, boundaries, _ = _scan_files(paths, 'my_ttree')
+    assert file_entries == [('tmp1.root', 25), ('tmp2.root', 25)]
+    assert boundaries == [0, 10, 20, 25, 35, 45, 50]
+    assert _get_file_metadata(('tmp1.root', 'my_ttree')) == [25, [0, 10, 20, 25]]
+    assert _get_file_metadata(('tmp1.root', 'other')) is None
+
+    chunks = list(read_root(paths, chunksize=10))
+    assert [len(df_) for df_ in chunks] == [10, 10, 5, 10, 10, 5]
+    assert_frame_equal(df, pd.concat(chunks))
+
+    expected = df[(df.x % 7 == 0) | (df.x > 40)].reset_index(drop=True)
+    for chunksize in [None, 10, 20]:
+        for n_workers in [None, 2]:
+            result = read_root(paths, where='(x % 7 == 0) || (x > 40)', pushdown=True, chunksize=chunksize,
+                               n_workers=n_workers)
+            if chunksize:
+                result = pd.concat(list(result))
+            assert_frame_equal(expected, result)
+
+    # Files smaller than chunksize are read in separate chunks
+    paths = ['tmp1.root', 'tmp2.root', 'tmp3.root']
+    for i, path in enumerate(paths):
+        df.iloc[i*6:(i+1)*6].to_root(path, store_index=False)
+    chunks = list(read_root(paths, chunksize=100))
+    assert [len(df_) for df_ in chunks] == [6, 6, 6]
+    assert_frame_equal(df.iloc[:18], pd.concat(chunks))
+    assert [len(df_) for df_ in read_root(paths, chunksize=100, n_workers=2)] == [6, 6, 6]
+    assert [len(df_) for df_ in read_root(paths, chunksize=100, chunk_align='entries')] == [18]
+
+    for path in paths:
+        os.remove(path)
+
+
+def test_chunk_memory():
+    from root_pandas.readwrite import estimate_entry_size, get_branch_sizes
+    df = pd.DataFrame({'x': np.arange(1000), 'y': np.arange(1000) * 0.5})
+    paths = ['tmp1.root', 'tmp2.root']
+    for path in paths:
+        df.to_root(path, store_index=False)
+
+    sizes = get_branch_sizes('tmp1.root', 'my_ttree')
+    assert sorted(sizes) == ['x', 'y']
+    assert sizes['x'][0] >= 8
+    assert not sizes['x'][2]
+
+    chunks = list(read_root(paths, chunk_memory='4KB'))
+    assert len(chunks) > 2
+    assert all(len(df_) * 16 <= 4000 for df_ in chunks)
+    assert_frame_equal(pd.concat([df, df]), pd.concat(chunks).reset_index(drop=True))
+    # chunksize limits the number of entries further
+    assert all(len(df_) <= 10 for df_ in read_root(paths, chunk_memory='4KB', chunksize=10))
+    # Chunks contain at least one entry
+    assert len(read_root('tmp1.root', chunk_memory=1)) == 1000
+
+    arr = np.zeros(100, dtype=[('n', 'i4'), ('x', 'f8', (5,))])
+    array2root(arr, 'tmp1.root', 'ntuple', mode='recreate')
+    # The budget applies to the flattened rows of 4 + 8 + 8 bytes
+    flattened = list(read_root('tmp1.root', chunk_memory='1KB', flatten=['x']))
+    assert len(flattened) > 1
+    assert all(len(df_) * 20 <= 1000 for df_ in flattened)
+    assert sum(len(df_) for df_ in flattened) == 500
+
+    sizes = {'n': [4., 1., False], 'x': [80., 10., True], 'y': [16., 2., True]}
+    assert estimate_entry_size(sizes, ['n']) == 4
+    assert estimate_entry_size(sizes, ['n', 'formula']) == 12
+    assert estimate_entry_size(sizes, ['n', 'x']) > 84
+    # The scalars and the __array_index column are repeated for every element
+    assert estimate_entry_size(sizes, ['n', 'x', 'y'], flatten=['x']) == 10 * (4 + 8) + 80
+
+    for path in paths:
+        os.remove(path)
+
+
+def test_parallel_reading():
+    df = pd.DataFrame({'x': np.arange(30), 'y': np.arange(30) * 0.5})
+    df.index.name = 'event'
+    paths = ['tmp1.root', 'tmp2.root', 'tmp3.root']
+    for i, path in enumerate(paths):
+        df.iloc[i*10:(i+1)*10].to_root(path)
+
+    df_ = read_root(paths, n_workers=2)
+    assert_frame_equal(df, df_)
+
+    df_ = read_root(paths, where='x % 3 == 0', n_workers=2)
+    assert_frame_equal(df[df.x % 3 == 0], df_)
+
+    chunks = read_root(paths, chunksize=4, n_workers=2)
+    assert_frame_equal(df, pd.concat(list(chunks)))
+
+    # start, stop and step apply to the entries of all files
+    assert_frame_equal(df.iloc[5:25], read_root(paths, start=5, stop=25, n_workers=2))
+    expected = df.iloc[5:25:2]
+    df_ = read_root(paths, where='x % 3 == 0', start=5, stop=25, step=2, n_workers=2)
+    assert_frame_equal(expected[expected.x % 3 == 0], df_)
+    assert_frame_equal(df.iloc[5:25], pd.concat(list(read_root(paths, chunksize=4, start=5, stop=25, n_workers=2))))
+
+    pool = multiprocessing.Pool(2)
+    try:
+        chunks = read_root(paths, chunksize=4, chunk_align='entries', executor=pool)
+        assert_frame_equal(df, pd.concat(list(chunks)))
+    finally:
+        pool.terminate()
+
+    for path in paths:
+        os.remove(path)
+
+
+def test_parallel_reading_flatten():
+    paths = ['tmp1.root', 'tmp2.root']
+    for i, path in enumerate(paths):
+        arr = np.empty(2, dtype=[('n', 'i4'), ('x', 'f8', (3,))])
+        arr['n'] = [2 * i, 2 * i + 1]
+        arr['x'] = np.arange(6).reshape(2, 3) + 10 * i
+        array2root(arr, path, 'ntuple', mode='recreate')
+
+    df = read_root(paths, flatten=['x'])
+    df_ = read_root(paths, flatten=['x'], n_workers=2)
+    assert_frame_equal(df, df_)
+    assert len(df_) == 12
+    assert np.all(df_['__array_index'] == np.tile([0, 1, 2], 4))
+
+    for path in paths:
+        os.remove(path)
+
+
+def test_chunked_reading_prefetch():
+    df = pd.DataFrame({'x': np.arange(20)})
+    df.to_root('tmp.root')
+
+    chunks = read_root('tmp.root', chunksize=3, prefetch=2)
+    assert len(chunks) == 7
+    assert_frame_equal(df, pd.concat(list(chunks)))
+
+    # Stopping early must not leave the reading thread blocked
+    for df_ in read_root('tmp.root', chunksize=3, prefetch=1):
+        assert_frame_equal(df.iloc[:3], df_)
+        break
+
+    with assert_raises(ValueError):
+        list(read_root('tmp.root', chunksize=3, prefetch=2, flatten=['x']))
+
+    os.remove('tmp.root')
+
+
+def test_chunked_reading_resume():
+    df = pd.DataFrame({'x': np.arange(30)})
+    paths = ['tmp1.root', 'tmp2.root', 'tmp3.root']
+    for i, path in enumerate(paths):
+        df.iloc[i*10:(i+1)*10].to_root(path, store_index=False)
+
+    chunks = read_root(paths, chunksize=4)
+    pairs = list(chunks.with_positions())
+    assert chunks.position == pairs[-1][1]
+    assert pairs[0][1] == {'file': 'tmp1.root', 'entry': 4, 'global_entry': 4, 'index': 4}
+    assert pairs[2][1] == {'file': 'tmp1.root', 'entry': 10, 'global_entry': 10, 'index': 10}
+    for i, (_, position) in enumerate(pairs):
+        rest = list(read_root(paths, chunksize=4, resume_from=json.loads(json.dumps(position))))
+        assert_frame_equal(df, pd.concat([df_ for df_, _ in pairs[:i + 1]] + rest))
+
+    # Chunks without selected entries are neither counted nor read
+    chunks = read_root(paths, chunksize=4, where='x % 10 < 2')
+    assert len(chunks) == 3
+    assert_frame_equal(df[df.x % 10 < 2].reset_index(drop=True), pd.concat(list(chunks)))
+
+    with assert_raises(ValueError):
+        read_root(paths, chunksize=4, resume_from={'file': 'tmp2.root', 'entry': 0, 'global_entry': 4, 'index': 4})
+    with assert_raises(ValueError):
+        read_root(paths, resume_from=pairs[0][1])
+
+    for path in paths:
+        os.remove(path)
+
+
+def test_pushdown():
+    from root_pandas.instrumentation import IOStats
+    df = pd.DataFrame({'x': np.arange(30), 'y': np.arange(30) * 0.5})
+    df.index.name = 'event'
+    paths = ['tmp1.root', 'tmp2.root', 'tmp3.root']
+    for i, path in enumerate(paths):
+        df.iloc[i*10:(i+1)*10].to_root(path)
+
+    for where in ['x > 24', 'x % 3 == 0', 'x < 0']:
+        expected = df[df.eval(where)]
+        stats = IOStats()
+        df_ = read_root(paths, where=where, pushdown=True, stats=stats)
+        assert_frame_equal(read_root(paths, where=where), df_)
+        assert_frame_equal(expected, df_)
+        assert stats.entries_selected == len(expected)
+        assert stats.entries_read + stats.entries_skipped == len(df)
+
+        chunks = list(read_root(paths, where=where, chunksize=4, pushdown=True))
+        assert_frame_equal(expected, pd.concat(chunks) if chunks else df_)
+
+        df_ = read_root(paths, where=where, pushdown=True, n_workers=2)
+        assert_frame_equal(expected, df_)
+
+    # Files without selected entries are skipped
+    stats = IOStats()
+    read_root(paths, where='x > 24', pushdown=True, stats=stats)
+    assert stats.entries_read == 10
+    assert stats.entries_skipped == 20
+
+    # Entry ranges apply to the entries before the selection
+    df_ = read_root(paths, where='x % 2 == 0', start=5, stop=25, step=3, pushdown=True)
+    assert_frame_equal(read_root(paths, where='x % 2 == 0', start=5, stop=25, step=3), df_)
+
+    for path in paths:
+        os.remove(path)
+
+
+def test_io_stats():
+    from root_pandas.instrumentation import IOStats
+    df = pd.DataFrame({'x': np.arange(30), 'c': pd.Categorical.from_codes(np.arange(30) % 3, ['a', 'b', 'c'])})
+
+    stats = IOStats()
+    df.to_root('tmp.root', stats=stats)
+    assert stats.entries_written == 30
+    assert stats.bytes_written > 0
+    assert stats.n_chunks == 1
+    assert set(['prepare', 'fill', 'write']) <= set(stats.timings)
+
+    chunks = []
+    stats = IOStats(on_chunk=chunks.append, keep_chunks=True)
+    frames = list(read_root('tmp.root', chunksize=10, stats=stats))
+    assert [chunk['rows'] for chunk in chunks] == [len(df_) for df_ in frames]
+    assert [chunk['index'] for chunk in chunks] == [0, 1, 2]
+    assert stats.chunks == chunks
+    assert sum(chunk['entries_read'] for chunk in chunks) == stats.entries_read == 30
+    assert stats.bytes_read > 0
+    assert stats.bytes_decompressed > 0
+    assert stats.peak_chunk_bytes == max(chunk['nbytes'] for chunk in chunks)
+    assert set(['metadata', 'read', 'convert', 'categorical']) <= set(stats.timings)
+    assert abs(stats.wall_time - sum(sum(chunk['timings'].values()) for chunk in chunks)) < 1e-6
+
+    # Nested stages are only counted once
+    stats = IOStats()
+    with stats.measure('outer'):
+        time.sleep(0.05)
+        with stats.measure('inner'):
+            time.sleep(0.05)
+    assert 0.04 < stats.timings['outer'] < 0.09
+    assert stats.chunks == []
+
+    # Shards written by worker processes are counted
+    stats = IOStats()
+    paths = df.to_root('tmp.root', shards=2, n_workers=2, stats=stats)
+    assert stats.entries_written == 30
+    assert stats.n_chunks == 2
+    for path in paths:
+        os.remove(path)
+    os.remove('tmp.root')
+
+
+def test_entry_selection():
+    from root_pandas.instrumentation import IOStats
+    df = pd.DataFrame({'x': np.arange(30), 'y': np.arange(30) * 0.5})
+    df.index.name = 'event'
+    paths = ['tmp1.root', 'tmp2.root', 'tmp3.root']
+    for i, path in enumerate(paths):
+        df.iloc[i*10:(i+1)*10].to_root(path)
+
+    for entries in [slice(5, 25), slice(None, 3), slice(-4, None), slice(20, 10), slice(1, None, 4)]:
+        assert_frame_equal(df.iloc[entries], read_root(paths, entries=entries))
+        chunks = list(read_root(paths, entries=entries, chunksize=4))
+        if chunks:
+            assert_frame_equal(df.iloc[entries], pd.concat(chunks))
+        expected = df.iloc[entries]
+        assert_frame_equal(expected[expected.x % 2 == 0], read_root(paths, entries=entries, where='x % 2 == 0'))
+
+    # Entries are sorted and counted over all files, and only their files are read
+    stats = IOStats()
+    df_ = read_root(paths, entry_list=[29, 3, -2, 3], stats=stats)
+    assert_frame_equal(df.iloc[[3, 28, 29]], df_)
+    assert stats.entries_read == 20
+    assert stats.entries_skipped == 10
+    assert_frame_equal(df.iloc[[3, 28]], read_root(paths, entry_list=[29, 3, -2], where='x < 29'))
+    assert_raises(IndexError, read_root, paths, entry_list=[30])
+
+    sample = read_root(paths, sample=0.5, seed=42)
+    assert_frame_equal(sample, read_root(paths, sample=0.5, seed=42))
+    assert_frame_equal(df.loc[sample.index], sample)
+    assert_frame_equal(sample, read_root(paths, sample=0.5, seed=42, n_workers=2))
+    assert len(read_root(paths, sample=0)) == 0
+    assert_frame_equal(df, read_root(paths, sample=1))
+
+    assert_raises(ValueError, read_root, paths, sample=1.5)
+    assert_raises(ValueError, read_root, paths, entries=slice(0, 10), sample=0.5)
+    assert_raises(ValueError, read_root, paths, entries=slice(0, 10), stop=5)
+
+    for path in paths:
+        os.remove(path)
+
+
+def test_query():
+    df = pd.DataFrame({'pt': np.arange(20) * 2.5, 'eta': np.linspace(-4, 4, 20), 'n': np.arange(20) % 4})
+    df.to_root('tmp.root', store_index=False)
+
+    query = '(pt > 20) & (abs(eta) < 2.5)'
+    expected = df.query(query).reset_index(drop=True)
+    assert_frame_equal(expected, read_root('tmp.root', query=query))
+
+    # Branches used by the query don't have to be read
+    df_ = read_root('tmp.root', columns=['n'], query=query)
+    assert_frame_equal(expected[['n']], df_)
+
+    chunks = read_root('tmp.root', chunksize=3, query='n in [1, 2] and not pt < 10')
+    assert_frame_equal(df.query('n in [1, 2] and not pt < 10').reset_index(drop=True), pd.concat(list(chunks)))
+
+    df_ = read_root('tmp.root', where='n == 3', query='eta > 0')
+    assert_frame_equal(df[(df.n == 3) & (df.eta > 0)].reset_index(drop=True), df_)
+
+    with assert_raises(ValueError):
+        read_root('tmp.root', query='missing > 1')
+    with assert_raises(ValueError):
+        read_root('tmp.root', query='pt + 1')
+
+    os.remove('tmp.root')
+
+
+def test_query_expressions():
+    from root_pandas.query import Query
+    arr = np.array([(1, 2.), (2, -1.), (3, 4.)], dtype=[('a', 'i4'), ('b', 'f8')])
+    assert list(Query('a > 1').mask(arr)) == [False, True, True]
+    assert list(Query('1 < a <= 2').mask(arr)) == [False, True, False]
+    assert list(Query('(a == 1) | (sqrt(abs(b)) > 1.5)').mask(arr)) == [True, False, True]
+    assert list(Query('a not in [1, 3]').mask(arr)) == [False, True, False]
+    assert Query('(x > 1) & (y < x)').names == ['x', 'y']
+
+    # & and | bind less tightly than comparisons, like in DataFrame.query
+    df = pd.DataFrame({'a': np.arange(4), 'b': np.arange(4)[::-1]})
+    arr = df.to_records(index=False)
+    for expression in ['a > 1 & b < 2', 'a == 0 | b == 0', 'a > 0 & b > 0 | a == 0', '~(a > 1) | b < 1 & a > 2']:
+        assert list(Query(expression).mask(arr)) == list(df.eval(expression)), expression
+    for expression in ['a.b > 1', 'system(a)', 'a > "1"', 'a >', '(a > 1']:
+        assert_raises(ValueError, Query, expression)
+
+
 def test_flatten():
     tf = ROOT.TFile('tmp.root', 'RECREATE')
     tt = ROOT.TTree("a", "a")
@@ -198,6 +690,32 @@ def to_object_array(array):
     return new_array
 
 
+def test_stretch():
+    from root_pandas.utils import stretch
+    arr = np.empty(3, dtype=[('scalar', 'i4'), ('vector', 'O'), ('fixed', 'f8', (2,))])
+    arr['scalar'] = [1, 2, 3]
+    arr['vector'] = to_object_array([np.array([1., 2.]), np.array([3., 4.]), np.array([5., 6.])])
+    arr['fixed'] = [[7, 8], [9, 10], [11, 12]]
+
+    stretched, idx = stretch(arr, return_indices=True)
+    assert stretched.dtype.names == ('scalar', 'vector', 'fixed')
+    assert np.all(stretched['scalar'] == [1, 1, 2, 2, 3, 3])
+    assert np.all(stretched['vector'] == [1, 2, 3, 4, 5, 6])
+    assert np.all(stretched['fixed'] == [7, 8, 9, 10, 11, 12])
+    assert np.all(idx == [0, 1, 0, 1, 0, 1])
+
+    # Variable lengths, including empty arrays
+    arr['vector'] = to_object_array([np.array([1., 2., 3.]), np.array([]), np.array([4.])])
+    stretched = stretch(arr, fields=['scalar', 'vector'], index_field='__array_index')
+    assert stretched.dtype.names == ('scalar', 'vector', '__array_index')
+    assert np.all(stretched['scalar'] == [1, 1, 1, 3])
+    assert np.all(stretched['vector'] == [1, 2, 3, 4])
+    assert np.all(stretched['__array_index'] == [0, 1, 2, 0])
+
+    with assert_raises(ValueError):
+        stretch(arr)
+
+
 def test_nonscalar_columns():
     array = np.array([1, 2, 3], dtype=np.int64)
     matrix = np.array([[1, 2, 3], [4, 5, 6]], dtype=np.int64)
@@ -230,6 +748,241 @@ def test_nonscalar_columns():
     os.remove(path)
 
 
+def test_convert_to_dataframe():
+    from root_pandas.readwrite import convert_to_dataframe
+    arr = np.empty(3, dtype=[('a', 'i4'), ('b', 'f8', (2,)), ('__index__ev', 'i8'),
+                             ('__rpCaT*c*True*x*y', 'i1'), ('d', 'f4')])
+    arr['a'] = [1, 2, 3]
+    arr['b'] = [[1, 2], [3, 4], [5, 6]]
+    arr['__index__ev'] = [10, 20, 30]
+    arr['__rpCaT*c*True*x*y'] = [1, 0, 1]
+    arr['d'] = [0.5, 1.5, 2.5]
+
+    df = convert_to_dataframe(arr)
+    assert list(df.columns) == ['a', 'b', 'c', 'd']
+    assert df.index.name == 'ev'
+    assert list(df.index) == [10, 20, 30]
+    assert df['a'].dtype == np.int32
+    assert df['d'].dtype == np.float32
+    assert np.all(df['b'].iloc[2] == np.array([5, 6]))
+    assert list(df['c']) == ['y', 'x', 'y']
+    assert df['c'].cat.ordered
+
+    df = convert_to_dataframe(arr[['a', 'd']], start_index=5)
+    assert list(df.index) == [5, 6, 7]
+
+
+def test_arrow_output():
+    try:
+        import pyarrow as pa
+    except ImportError:
+        from nose.plugins.skip import SkipTest
+        raise SkipTest('pyarrow is not installed')
+    from root_pandas.arrow import convert_to_arrow
+
+    arr = np.empty(3, dtype=[('a', 'i4'), ('b', 'f8', (2,)), ('j', 'O'), ('__index__ev', 'i8'),
+                             ('__rpCaT*c*True*x*y', 'i1')])
+    arr['a'] = [1, 2, 3]
+    arr['b'] = [[1, 2], [3, 4], [5, 6]]
+    for i in range(3):
+        arr['j'][i] = np.arange(i, dtype='f4')
+    arr['__index__ev'] = [10, 20, 30]
+    arr['__rpCaT*c*True*x*y'] = [1, 0, -1]
+
+    table = convert_to_arrow(arr)
+    assert table.column_names == ['a', 'b', 'j', 'ev', 'c']
+    assert table.schema.field('a').type == pa.int32()
+    assert table.schema.field('b').type == pa.list_(pa.float64(), 2)
+    assert table.schema.field('j').type == pa.list_(pa.float32())
+    assert table.column('j').to_pylist() == [[], [0], [0, 1]]
+    assert table.column('c').to_pylist() == ['y', 'x', None]
+    assert isinstance(convert_to_arrow(arr, batch=True), pa.RecordBatch)
+
+    df = pd.DataFrame({'x': np.arange(10), 'y': np.arange(10) * 0.5})
+    df.to_root('tmp.root', store_index=False)
+    table = read_root('tmp.root', where='x > 2', output='arrow')
+    assert isinstance(table, pa.Table)
+    assert_frame_equal(df[df.x > 2].reset_index(drop=True), table.to_pandas())
+    batches = list(read_root('tmp.root', chunksize=4, output='arrow'))
+    assert all(isinstance(batch, pa.RecordBatch) for batch in batches)
+    assert_frame_equal(df, pa.Table.from_batches(batches).to_pandas())
+    assert_raises(ValueError, read_root, 'tmp.root', output='numpy')
+    os.remove('tmp.root')
+
+
+def test_jagged_offsets():
+    from root_pandas.jagged import JaggedArray
+    tf = ROOT.TFile('tmp.root', 'RECREATE')
+    tt = ROOT.TTree("a", "a")
+    length = np.array([0], dtype=np.int32)
+    x = np.zeros(3, dtype='float64')
+    y = np.zeros(2, dtype='int32')
+    tt.Branch('length', length, 'length/I')
+    tt.Branch('x', x, 'x[length]/D')
+    tt.Branch('y', y, 'y[2]/I')
+    for i in range(4):
+        length[0] = i
+        x[:i] = np.arange(i) + 10 * i
+        y[:] = [i, -i]
+        tt.Fill()
+    tf.Write()
+    tf.Close()
+
+    df = read_root('tmp.root', jagged='offsets')
+    assert isinstance(df['x'].values, JaggedArray)
+    assert isinstance(df['y'].values, JaggedArray)
+    assert list(df['x'].jagged.lengths) == [0, 1, 2, 3]
+    assert list(df['y'].jagged.lengths) == [2, 2, 2, 2]
+    assert np.all(df['x'].jagged.flatten().values == [10, 20, 21, 30, 31, 32])
+    assert np.all(df['x'].iloc[2] == [20, 21])
+    assert np.all(df['y'].jagged.element(1).values == [0, -1, -2, -3])
+
+    # The content of a chunk only contains the values of that chunk
+    chunks = list(read_root('tmp.root', chunksize=2, jagged='offsets'))
+    assert np.all(chunks[1]['x'].jagged.flatten().values == [20, 21, 30, 31, 32])
+
+    # Write the jagged columns back without converting them to arrays per row
+    df.to_root('tmp2.root')
+    df_ = read_root('tmp2.root', jagged='offsets')
+    assert list(df_.columns) == ['length', 'x', 'y']
+    assert df_['x'].dtype == df['x'].dtype
+    assert np.all(df_['x'].values.offsets == df['x'].values.offsets)
+    assert np.all(df_['x'].jagged.flatten().values == df['x'].jagged.flatten().values)
+    assert np.all(df_['y'].jagged.flatten().values == df['y'].jagged.flatten().values)
+
+    # Without jagged='offsets' the columns contain arrays
+    df_ = read_root('tmp2.root')
+    assert list(df_.columns) == ['length', 'x', 'y']
+    assert np.all(df_['x'].iloc[3] == [30, 31, 32])
+
+    # Append to the existing branches
+    df.iloc[1:].to_root('tmp2.root', mode='a')
+    df_ = read_root('tmp2.root', jagged='offsets')
+    assert list(df_['x'].jagged.lengths) == [0, 1, 2, 3, 1, 2, 3]
+
+    with assert_raises(ValueError):
+        read_root('tmp.root', jagged='objects')
+
+    os.remove('tmp.root')
+    os.remove('tmp2.root')
+
+
+def test_jagged_array_operations():
+    from root_pandas.jagged import JaggedArray
+    s = pd.Series(JaggedArray.from_objects([np.array([1., 2.]), np.array([]), np.array([3.]), np.array([1., 2.])]))
+    assert list(s == s) == [True] * 4
+    assert list(s != s) == [False] * 4
+    assert list(s.values == [[1, 2], [], [4], [1, 3]]) == [True, True, False, False]
+
+    # Missing rows are empty arrays
+    shifted = s.shift(1)
+    assert shifted.dtype == s.dtype
+    assert list(shifted.jagged.lengths) == [0, 2, 0, 1]
+    assert list(JaggedArray._from_sequence([None, np.nan, [1.]]).lengths) == [0, 0, 1]
+
+    assert list(s.unique().lengths) == [2, 0, 1]
+    assert list(s.duplicated()) == [False, False, False, True]
+    assert list(s.value_counts(sort=False)) == [2, 1, 1]
+    df = pd.DataFrame({'g': [0, 1, 0, 1], 'x': s})
+    first = df.groupby('g')['x'].first()
+    assert list(first.jagged.lengths) == [2, 0]
+    assert list(df.groupby('x', sort=False)['g'].sum()) == [1, 1, 0]
+
+
+def test_metadata_cache():
+    from root_pandas import metadata_cache
+    from root_pandas.cache import MetadataCache
+    import shutil
+    import tempfile
+
+    df = pd.DataFrame({'x': [1, 2, 3]})
+    df.to_root('tmp.root', key='first')
+    metadata_cache.clear()
+    assert_frame_equal(df, read_root('tmp.root'))
+    assert len(metadata_cache) > 0
+    assert metadata_cache.lookup('tmp.root', 'trees') == (True, ['first'])
+    assert_frame_equal(df, read_root('tmp.root'))
+
+    # Modified files are read again
+    os.remove('tmp.root')
+    df = pd.DataFrame({'x': [1, 2, 3, 4], 'y': [5, 6, 7, 8]})
+    df.to_root('tmp.root', key='second')
+    assert_frame_equal(df, read_root('tmp.root'))
+    assert_frame_equal(df, pd.concat(list(read_root('tmp.root', chunksize=3))))
+
+    sidecar_dir = tempfile.mkdtemp()
+    try:
+        cache = MetadataCache(maxsize=2, sidecar_dir=sidecar_dir)
+        calls = []
+        assert cache.get('tmp.root', 'a', [1], lambda: calls.append(1) or [1, 2]) == [1, 2]
+        assert cache.get('tmp.root', 'a', [1], lambda: calls.append(1) or [1, 2]) == [1, 2]
+        assert len(calls) == 1
+        cache.store('tmp.root', 'b', [], 'b')
+        cache.store('tmp.root', 'c', [], 'c')
+        assert len(cache) == 2
+        # Evicted from memory but still available from the sidecar
+        cache.clear()
+        assert cache.lookup('tmp.root', 'a', [1]) == (True, [1, 2])
+        assert MetadataCache(sidecar_dir=sidecar_dir).lookup('tmp.root', 'c') == (True, 'c')
+        # Remote files aren't cached
+        cache.store('root://example.org//file.root', 'a', [], 'a')
+        assert cache.lookup('root://example.org//file.root', 'a') == (False, None)
+    finally:
+        shutil.rmtree(sidecar_dir)
+
+    os.remove('tmp.root')
+    assert metadata_cache.lookup('tmp.root', 'trees') == (False, None)
+
+
+def test_data_cache():
+    from root_pandas.cache import DataCache, parse_size
+    from root_pandas.instrumentation import IOStats
+    import shutil
+    import tempfile
+
+    df = pd.DataFrame({'x': np.arange(100), 'y': np.arange(100) * 0.5,
+                       'z': pd.Categorical.from_codes(np.arange(100) % 2, ['a', 'b'])})
+    df.to_root('tmp.root')
+    cache_dir = tempfile.mkdtemp()
+    try:
+        expected = df[df.x > 20]
+        assert_frame_equal(expected, read_root('tmp.root', where='x > 20', cache_dir=cache_dir))
+        stats = IOStats()
+        df_ = read_root('tmp.root', where='x > 20', cache_dir=cache_dir, stats=stats)
+        assert_frame_equal(expected, df_)
+        assert 'read' not in stats.timings
+        # Changing the DataFrame doesn't change the cache
+        df_['x'] += 1
+        assert_frame_equal(expected, read_root('tmp.root', where='x > 20', cache_dir=cache_dir))
+
+        # Different options are cached separately
+        assert_frame_equal(df[['x']], read_root('tmp.root', columns=['x'], cache_dir=cache_dir))
+        assert len(DataCache(cache_dir).entries()) == 2
+
+        # Modified files are read again
+        time.sleep(0.01)
+        df = df.iloc[:50]
+        df.to_root('tmp.root')
+        assert_frame_equal(df[df.x > 20], read_root('tmp.root', where='x > 20', cache_dir=cache_dir))
+
+        # The least recently used entries are evicted
+        size = max(size for _, size, _ in DataCache(cache_dir).entries())
+        read_root('tmp.root', columns=['y'], cache_dir=cache_dir, cache_size=2 * size)
+        assert len(DataCache(cache_dir).entries()) <= 2
+
+        assert_raises(ValueError, read_root, 'tmp.root', chunksize=10, cache_dir=cache_dir)
+    finally:
+        shutil.rmtree(cache_dir)
+
+    assert parse_size(100) == 100
+    assert parse_size('512MB') == 512 * 10**6
+    assert parse_size('1.5 GiB') == 3 * 2**29
+    assert_raises(ValueError, parse_size, '1 PB')
+    assert_raises(ValueError, parse_size, -1)
+
+    os.remove('tmp.root')
+
+
 def test_get_matching_variables_performance():
     """Performance regression test for #59"""
     import random
@@ -241,6 +994,187 @@ def test_get_matching_variables_performance():
         root_pandas.readwrite.get_matching_variables(branches, patterns, fail=False)
         root_pandas.readwrite.get_matching_variables(branches, branches, fail=False)
 
+    def best_time(function, *args):
+        timings = []
+        for i in range(3):
+            start = time.time()
+            function(*args)
+            timings.append(time.time() - start)
+        return min(timings)
+
+    def match_columns(branches, patterns):
+        root_pandas.readwrite.compile_patterns(patterns).match(branches, fail=False)
+
+    # The time taken should scale linearly with the number of branches and patterns
+    timings = {}
+    for n in [2000, 16000]:
+        branches = ['branch_{}_{}'.format(i, j) for i in range(n // 10) for j in range(10)]
+        cases = [
+            ('exact', branches[::-1]),
+            ('braces', ['branch_{}_{{0,5,9}}'.format(i) for i in range(n // 10)]),
+            ('glob', ['branch_1*', 'branch_*_3', 'branch_[24]?_?', 'missing*']),
+        ]
+        for name, patterns in cases:
+            root_pandas.readwrite._compiled_patterns.clear()
+            timings[name, n] = best_time(match_columns, branches, patterns)
+    for name in ['exact', 'braces', 'glob']:
+        assert timings[name, 16000] < 32 * max(timings[name, 2000], 1e-3), (name, timings)
+
+
+def test_get_matching_variables_order():
+    from root_pandas.readwrite import get_matching_variables
+    branches = ['x1', 'y1', 'x2', 'y2', 'z']
+    assert get_matching_variables(branches, ['z', 'y*', 'x*']) == ['z', 'y1', 'y2', 'x1', 'x2']
+    assert get_matching_variables(branches, ['*2', 'x1', 'x*']) == ['x1', 'x2', 'y2']
+    assert get_matching_variables(branches, ['w*', 'x1'], fail=False) == ['x1']
+    assert_raises(ValueError, get_matching_variables, branches, ['w*', 'x1'])
+    assert_raises(ValueError, get_matching_variables, branches, ['w'])
+
+
+def test_lazy():
+    from root_pandas.instrumentation import IOStats
+    from root_pandas.lazy import LazyFrame
+    df = pd.DataFrame({'x': np.arange(20), 'y': np.arange(20) * 0.5,
+                       'c': pd.Categorical.from_codes(np.arange(20) % 2, ['a', 'b'])})
+    df.index.name = 'event'
+    df.to_root('tmp.root')
+
+    stats = IOStats()
+    frame = read_root('tmp.root', lazy=True, stats=stats)
+    assert isinstance(frame, LazyFrame)
+    assert list(frame.columns) == ['x', 'y', 'c']
+    assert frame.loaded == []
+    # The number of rows is known from the number of entries
+    assert len(frame) == 20
+    assert frame.shape == (20, 3)
+    assert stats.entries_read == 0
+
+    assert_frame_equal(df[['y']], frame[['y']])
+    assert frame.loaded == ['y']
+    assert frame.index.name == 'event'
+    pd.testing.assert_series_equal(df['c'], frame['c'])
+    pd.testing.assert_series_equal(df['x'], frame.x)
+    assert_frame_equal(df, frame.to_dataframe())
+    assert_raises(KeyError, frame.__getitem__, 'z')
+
+    # The options apply to every read
+    frame = read_root('tmp.root', lazy=True, where='x > 4', query='y < 8', columns=['x', 'noexpand:2*y'])
+    assert list(frame.columns) == ['x', '2*y']
+    expected = df[(df.x > 4) & (df.y < 8)]
+    assert_frame_equal(expected[['x']], frame[['x']])
+    assert np.all(frame['2*y'].values == 2 * expected['y'].values)
+    assert len(frame) == len(expected)
+
+    stats = IOStats()
+    frame = read_root('tmp.root', lazy=True, entries=slice(5, 12), stats=stats)
+    assert len(frame) == 7
+    assert stats.entries_read == 0
+    # Only the columns which were accessed are materialised
+    frame['y']
+    assert_frame_equal(df.iloc[5:12][['y']], frame.to_dataframe())
+    assert stats.entries_read == 7
+    assert_frame_equal(df.iloc[5:12], frame.to_dataframe(frame.columns))
+
+    # Samples are drawn once for all columns
+    frame = read_root('tmp.root', lazy=True, sample=0.5)
+    assert_frame_equal(df.loc[frame.index], frame.to_dataframe(frame.columns))
+
+    assert_raises(ValueError, read_root, 'tmp.root', lazy=True, chunksize=5)
+    os.remove('tmp.root')
+
+
+def test_plan_chunks():
+    import pickle
+    from root_pandas import plan_chunks, read_chunk
+    df = pd.DataFrame({'x': np.arange(30), 'y': np.arange(30) * 0.5})
+    paths = ['tmp1.root', 'tmp2.root', 'tmp3.root']
+    for i, path in enumerate(paths):
+        df.iloc[i*10:(i+1)*10].to_root(path, store_index=False)
+
+    units = plan_chunks(paths, chunksize=4)
+    assert [(unit.path, unit.start, unit.stop, unit.entry) for unit in units[:4]] == [
+        ('tmp1.root', 0, 4, 0), ('tmp1.root', 4, 8, 4), ('tmp1.root', 8, 10, 8), ('tmp2.root', 0, 4, 10)]
+    units = pickle.loads(pickle.dumps(units))
+    assert_frame_equal(df, pd.concat([read_chunk(unit) for unit in units]))
+
+    # Units are read independently, and rows keep the number of their entry
+    pool = multiprocessing.Pool(2)
+    try:
+        frames = pool.map(read_chunk, plan_chunks(paths, columns=['x'], chunksize=4, where='y > 6', query='x % 2 == 0'))
+    finally:
+        pool.terminate()
+        pool.join()
+    expected = df[(df.y > 6) & (df.x % 2 == 0)][['x']]
+    assert_frame_equal(expected, pd.concat(frames))
+
+    # Chunks spanning files are split
+    units = plan_chunks(paths, chunksize=25, chunk_align='entries')
+    assert [unit.n_entries for unit in units] == [10, 10, 5, 5]
+    assert_frame_equal(df, pd.concat([read_chunk(unit) for unit in units]))
+
+    # Units without selected entries are empty, also when flattening
+    arr = np.empty(20, dtype=[('n', 'i4'), ('x', 'f8', (3,))])
+    arr['n'] = np.arange(20)
+    arr['x'] = np.arange(60).reshape(20, 3)
+    array2root(arr, 'tmp4.root', 'ntuple', mode='recreate')
+    frames = [read_chunk(unit) for unit in plan_chunks('tmp4.root', chunksize=5, where='n >= 15', flatten=['x'])]
+    assert [len(df_) for df_ in frames] == [0, 0, 0, 15]
+    assert list(frames[0].columns) == ['n', 'x', '__array_index']
+    assert frames[0].dtypes.equals(frames[-1].dtypes)
+    assert np.all(frames[-1].index == np.repeat(np.arange(15, 20), 3))
+
+    for path in paths + ['tmp4.root']:
+        os.remove(path)
+
+
+def test_read_root_dask():
+    try:
+        import dask  # noqa
+    except ImportError:
+        from nose.plugins.skip import SkipTest
+        raise SkipTest('dask is not installed')
+    from root_pandas import read_root_dask
+    df = pd.DataFrame({'x': np.arange(30), 'y': np.arange(30) * 0.5})
+    paths = ['tmp1.root', 'tmp2.root', 'tmp3.root']
+    for i, path in enumerate(paths):
+        df.iloc[i*10:(i+1)*10].to_root(path, store_index=False)
+
+    ddf = read_root_dask(paths, chunksize=4)
+    assert ddf.npartitions == 9
+    assert ddf.divisions == (0, 4, 8, 10, 14, 18, 20, 24, 28, 29)
+    assert_frame_equal(df.iloc[:0], ddf._meta)
+    for scheduler in ['threads', 'processes']:
+        assert_frame_equal(df, ddf.compute(scheduler=scheduler))
+    assert_frame_equal(df.loc[12:16], ddf.loc[12:16].compute())
+
+    ddf = read_root_dask(paths, columns=['x'], where='y > 10')
+    assert ddf.npartitions == 3
+    assert_frame_equal(df[df.y > 10][['x']], ddf.compute(scheduler='threads'))
+
+    # The divisions are taken from a sorted __index__ branch
+    df.index = df.index * 2
+    df.index.name = 'event'
+    df.to_root('tmp1.root')
+    ddf = read_root_dask('tmp1.root', chunksize=10)
+    assert ddf.divisions == (0, 20, 40, 58)
+    assert_frame_equal(df, ddf.compute(scheduler='threads'))
+    df.iloc[::-1].to_root('tmp1.root')
+    assert not read_root_dask('tmp1.root', chunksize=10).known_divisions
+
+    arr = np.empty(20, dtype=[('n', 'i4'), ('x', 'f8', (3,))])
+    arr['n'] = np.arange(20)
+    arr['x'] = np.arange(60).reshape(20, 3)
+    array2root(arr, 'tmp1.root', 'ntuple', mode='recreate')
+    ddf = read_root_dask('tmp1.root', chunksize=5, flatten=['x'], where='n > 2')
+    assert list(ddf.columns) == ['n', 'x', '__array_index']
+    df = ddf.compute(scheduler='threads')
+    assert len(df) == 51
+    assert np.all(df.index == np.repeat(np.arange(3, 20), 3))
+    assert_frame_equal(ddf._meta, df.iloc[:0])
+
+    for path in paths:
+        os.remove(path)
+
 
 def test_noexpand_prefix():
     xs = np.array([1, 2, 3])